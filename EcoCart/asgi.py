@@ -1,14 +1,21 @@
 import os
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
-import shopping.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EcoCart.settings')
+# 先初始化 Django，再导入会用到模型和配置的模块
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from users.middleware import JWTAuthMiddleware  # noqa: E402
+import shopping.routing  # noqa: E402
+from shopping.services.suggest import suggest_index  # noqa: E402
+
+# 搜索联想的前缀树在启动时构建（AppConfig.ready 里不能查库：migrate、测试时表还不存在）
+suggest_index.warm()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    "websocket": JWTAuthMiddleware(
         URLRouter(
             shopping.routing.websocket_urlpatterns
         )
@@ -13,6 +13,26 @@ app.conf.beat_schedule = {
         'task': 'shopping.tasks.check_expiring_products',
         'schedule': crontab(minute=0, hour=0),  # 每天午夜执行
     },
+    'flip-effective-prices': {
+        'task': 'shopping.tasks.flip_effective_prices',
+        'schedule': crontab(),  # 每分钟执行，处理折扣的开始/结束
+    },
+    'rebuild-category-affinities': {
+        'task': 'shopping.tasks.rebuild_category_affinities',
+        'schedule': crontab(minute=30, hour=3),  # 每天凌晨 3:30 全量校准
+    },
+    'rollup-dashboard-stats': {
+        'task': 'shopping.tasks.rollup_dashboard_stats',
+        'schedule': crontab(minute=10),  # 每小时第 10 分钟增量汇总
+    },
+    'reconcile-popularity-counters': {
+        'task': 'shopping.tasks.reconcile_popularity_counters',
+        'schedule': crontab(minute=0, hour=3),  # 每天凌晨 3 点校准 Redis 计数器
+    },
+    'build-product-neighbours': {
+        'task': 'shopping.tasks.build_product_neighbours',
+        'schedule': crontab(minute=0, hour=4),  # 每天凌晨 4 点重建商品相似度
+    },
 }
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
@@ -30,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "django.contrib.sites",  
     'rest_framework',
     'rest_framework_simplejwt',
@@ -87,7 +88,9 @@ AUTH_USER_MODEL = "users.CustomUser"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+    ),
+    # 所有列表接口统一使用游标分页
+    "DEFAULT_PAGINATION_CLASS": "shopping.pagination.StableCursorPagination",
 }
 
 SIMPLE_JWT = {
@@ -136,6 +139,18 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# 缓存（商品目录、供应商列表等），和 Channels / Celery 共用 Redis，使用 1 号库
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+        'KEY_PREFIX': 'ecocart',
+    }
+}
+
+# 商品热度、活跃用户等统计计数器（有序集合 / HyperLogLog），使用 2 号库
+ANALYTICS_REDIS_URL = 'redis://127.0.0.1:6379/2'
+
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -0,0 +1,45 @@
+# EcoCart/settings_test.py
+"""
+运行测试用的配置：缓存和 channel layer 换成进程内实现，测试不需要 Redis。
+数据库默认仍然是 PostgreSQL（全文检索依赖它），没有 PostgreSQL 时设置 TEST_DB_ENGINE=sqlite。
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import os, SIMPLE_JWT
+
+SECRET_KEY = os.getenv('SECRET_KEY') or 'ecocart-test-secret-key-not-for-production'
+SIMPLE_JWT = {**SIMPLE_JWT, 'SIGNING_KEY': SECRET_KEY}
+
+if os.getenv('TEST_DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+CELERY_TASK_ALWAYS_EAGER = True
+
+# 热度计数器使用单独的 15 号库，本地开着 Redis 时也不会写进开发数据
+ANALYTICS_REDIS_URL = 'redis://127.0.0.1:6379/15'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        # 没有 Redis 时计数器写入失败只记录警告，测试输出里不需要
+        'shopping.services.popularity': {'level': 'ERROR'},
+    },
+}
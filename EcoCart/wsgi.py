@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EcoCart.settings')
 
 application = get_wsgi_application()
+
+from shopping.services.suggest import suggest_index  # noqa: E402
+
+# 搜索联想的前缀树在启动时构建，第一个请求不用等
+suggest_index.warm()
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EcoCart.settings')
+    # 运行测试时默认使用内存缓存和内存 channel layer
+    default_settings = 'EcoCart.settings_test' if sys.argv[1:2] == ['test'] else 'EcoCart.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -1,26 +1,103 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .services.live import can_subscribe, diffs_since, group_name
+
+# 这个时间窗口内收到的 diff 合并成一帧发送
+COALESCE_WINDOW = 0.05
+
 
 class ShoppingListConsumer(AsyncWebsocketConsumer):
+    """
+    连接需要 JWT（见 users.middleware），且必须是清单的 owner 或被共享的用户。
+    只推送服务端产生的 diff（REST 修改清单项后发布），客户端发来的消息不再转发给其他人。
+    帧格式：{"type": "diffs", "from_seq": 11, "seq": 15, "diffs": [...]}；
+    除 removed 以外的 diff 都带完整的清单项，客户端按 product_id upsert 即可；
+    需要重新拉取整个清单时发 {"type": "resync", "seq": 15}。
+    """
+
     async def connect(self):
         self.list_id = self.scope['url_route']['kwargs']['list_id']
-        self.group_name = f'shopping_list_{self.list_id}'
+        self.group_name = group_name(self.list_id)
+        self.pending = []
+        self.flush_task = None
+        self.joined = False
 
+        # 只在连接时检查一次权限，之后的消息不再访问数据库。
+        # 握手阶段直接 close() 客户端只会看到 HTTP 403，先 accept() 再关闭，客户端才能拿到 4401 / 4403
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or not self.list_id.isdigit():
+            await self.reject(4401)
+            return
+        if not await database_sync_to_async(can_subscribe)(int(self.list_id), user.id):
+            await self.reject(4403)
+            return
+
+        self.joined = True
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
+        # ws/list/<id>/?since=<seq>：断线重连时从上次收到的序号续传
+        since = parse_qs(self.scope.get('query_string', b'').decode()).get('since')
+        if since:
+            await self.resume(since[0])
+
+    async def reject(self, code):
+        await self.accept()
+        await self.close(code=code)
+
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        if self.joined:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and message.get('action') == 'resume':
+            await self.resume(message.get('since'))
+        else:
+            await self.send_json({'type': 'error', 'detail': 'Unsupported message.'})
+
+    async def resume(self, since):
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'detail': 'since must be an integer.'})
+            return
+        seq, diffs = await diffs_since(self.list_id, since)
+        if diffs is None:
+            await self.send_json({'type': 'resync', 'seq': seq})
+        elif diffs:
+            await self.send_diffs(diffs)
+
+    async def list_diffs(self, event):
+        # 先缓冲，窗口结束时一次性发送
+        self.pending.extend(event['diffs'])
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later())
 
-    async def receive(self, text_data):
-        # 广播给所有连接这个购物清单的用户
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                'type': 'shopping_list_update',
-                'message': text_data,
-            }
-        )
+    async def flush_later(self):
+        await asyncio.sleep(COALESCE_WINDOW)
+        self.flush_task = None
+        diffs, self.pending = self.pending, []
+        await self.send_diffs(diffs)
 
-    async def shopping_list_update(self, event):
-        await self.send(text_data=event['message'])
+    async def send_diffs(self, diffs):
+        diffs = sorted(diffs, key=lambda diff: diff['seq'])
+        # 同一个商品在一帧里只保留最后一次变化
+        latest = {diff['product_id']: diff for diff in diffs}
+        await self.send_json({
+            'type': 'diffs',
+            'from_seq': diffs[0]['seq'],
+            'seq': diffs[-1]['seq'],
+            'diffs': sorted(latest.values(), key=lambda diff: diff['seq']),
+        })
 
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content))
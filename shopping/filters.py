@@ -0,0 +1,15 @@
+from rest_framework import filters
+from .services.search import search_products
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    替代 icontains 的商品搜索：Postgres 上走全文检索 + trigram，
+    SQLite 上走内存倒排索引，结果按相关度排序。
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_products(queryset, query)
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import CustomUser
+from shopping.models import Supplier, Product, ProductSupplier, ShoppingList, ShoppingItem
+from shopping.management.commands.bench_websockets import percentile
+
+BENCH_PREFIX = 'bench_async_'
+
+# 共享清单只有 async 实现，不在对比范围内
+ENDPOINTS = ('compare-prices', 'expiring', 'expired', 'recommendations')
+
+
+class Command(BaseCommand):
+    help = '并发请求热点只读接口，对比 sync 视图和 async 视图在 ASGI 下的吞吐量和延迟分位数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--requests', type=int, default=200, help='每个接口、每个并发级别的请求数')
+        parser.add_argument('--items', type=int, default=50, help='清单里的商品数')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        user, product = self.seed(options['items'])
+        try:
+            token = str(AccessToken.for_user(user))
+            # 同步的“快过期”和“已过期”接口共用一个 URL 名字，reverse 只能拿到后一个，直接写路径
+            urls = {
+                'compare-prices': (
+                    reverse('compare-product-prices', kwargs={'product_id': product.pk}),
+                    reverse('async-compare-product-prices', kwargs={'product_id': product.pk}),
+                ),
+                'expiring': ('/shopping/shopping-items/expiring/', reverse('async-expiring-products')),
+                'expired': ('/shopping/shopping-items/expired/', reverse('async-expired-products')),
+                'recommendations': (reverse('recommended-products'), reverse('async-recommended-products')),
+            }
+            for name in options['endpoints']:
+                sync_url, async_url = urls[name]
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} =='))
+                for concurrency in options['concurrency']:
+                    for label, url in (('sync', sync_url), ('async', async_url)):
+                        report = asyncio.run(self.run(url, token, concurrency, options['requests']))
+                        self.print_report(label, concurrency, report)
+        finally:
+            self.cleanup()
+
+    def seed(self, item_count):
+        user, _ = CustomUser.objects.get_or_create(
+            username=f'{BENCH_PREFIX}user', defaults={'email': f'{BENCH_PREFIX}user@example.com'},
+        )
+        vendor, _ = CustomUser.objects.get_or_create(
+            username=f'{BENCH_PREFIX}vendor', defaults={'email': f'{BENCH_PREFIX}vendor@example.com'},
+        )
+        supplier, _ = Supplier.objects.get_or_create(user=vendor, defaults={'company_name': f'{BENCH_PREFIX}supplier'})
+
+        products = Product.objects.bulk_create([
+            Product(name=f'{BENCH_PREFIX}product_{i}', category='fruit') for i in range(item_count)
+        ])
+        # 逐条创建报价，让信号生成物化价格
+        for i, product in enumerate(products):
+            ProductSupplier.objects.create(product=product, supplier=supplier, price=1 + i % 10)
+
+        shopping_list = ShoppingList.objects.create(owner=user, name=f'{BENCH_PREFIX}list')
+        today = timezone.now().date()
+        ShoppingItem.objects.bulk_create([
+            ShoppingItem(
+                list=shopping_list, product=product, quantity=1,
+                # 一半快过期、一半已过期
+                expiration_date=today + timedelta(days=1 if i % 2 else -1),
+            )
+            for i, product in enumerate(products)
+        ])
+        return user, products[0]
+
+    def cleanup(self):
+        CustomUser.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+
+    async def run(self, url, token, concurrency, total):
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {token}'}
+        # 预热：填好缓存、建立数据库连接
+        response = await client.get(url, headers=headers)
+        if response.status_code != 200:
+            raise CommandError(f'{url} returned {response.status_code}: {response.content[:200]!r}')
+
+        latencies = []
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                await client.get(url, headers=headers)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return {'elapsed': time.perf_counter() - started, 'latencies': latencies}
+
+    def print_report(self, label, concurrency, report):
+        latencies_ms = [latency * 1000 for latency in report['latencies']]
+        self.stdout.write(
+            f"{label:<6} c={concurrency:<4} {len(latencies_ms) / report['elapsed']:8.0f} req/s  "
+            f"p50 {percentile(latencies_ms, 50):7.1f} ms  p95 {percentile(latencies_ms, 95):7.1f} ms"
+        )
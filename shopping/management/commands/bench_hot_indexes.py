@@ -0,0 +1,154 @@
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from users.models import CustomUser
+from shopping.models import Supplier, Product, ProductSupplier, Discount, ShoppingList, ShoppingItem
+
+BENCH_PREFIX = 'bench_idx_'
+
+
+class Command(BaseCommand):
+    help = '灌入大量测试数据，对比热点查询在有/无复合索引时的执行计划和耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--products', type=int, default=1_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--skip-seed', action='store_true', help='复用上次灌入的数据')
+        parser.add_argument('--cleanup', action='store_true', help='只删除测试数据')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.cleanup()
+            return
+
+        if not options['skip_seed']:
+            self.seed(options['items'], options['users'], options['products'], options['batch_size'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        queries = self.hot_queries()
+
+        # DDL 放在事务里删除索引再回滚，得到“没有索引”时的执行计划
+        self.stdout.write(self.style.MIGRATE_HEADING('== 删除索引（事务内，结束后回滚） =='))
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (ShoppingItem, Discount, ProductSupplier):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+            self.explain_all(queries)
+            transaction.set_rollback(True)
+
+        # 重新连接，避免复用缓存的执行计划
+        connection.close()
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== 使用索引 =='))
+        self.explain_all(queries)
+
+    def hot_queries(self):
+        today = timezone.now().date()
+        soon = today + timedelta(days=3)
+        now = timezone.now()
+        owner = CustomUser.objects.filter(username__startswith=BENCH_PREFIX).order_by('pk').first()
+        offer = ProductSupplier.objects.filter(product__name__startswith=BENCH_PREFIX).order_by('pk').first()
+
+        return {
+            'ExpiringProductsView': ShoppingItem.objects.filter(
+                list__owner=owner, expiration_date__range=(today, soon), reminder_sent=False
+            ),
+            'ExpiredProductView': ShoppingItem.objects.filter(
+                list__owner=owner, expiration_date__lt=today
+            ),
+            'check_expiring_products': ShoppingItem.objects.filter(
+                expiration_date__range=(today, soon), reminder_sent=False
+            ),
+            'active discount': Discount.objects.filter(
+                product_id=offer.product_id, supplier_id=offer.supplier_id,
+                valid_from__lte=now, valid_until__gte=now
+            ),
+            'offers by price': ProductSupplier.objects.filter(product_id=offer.product_id).order_by('price'),
+        }
+
+    def explain_all(self, queries):
+        for name, queryset in queries.items():
+            started = time.perf_counter()
+            count = len(list(queryset.values_list('pk', flat=True)))
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f'-- {name}: {count} rows, {elapsed:.2f} ms'))
+            self.stdout.write(queryset.explain())
+
+    def seed(self, item_count, user_count, product_count, batch_size):
+        # 同一清单里每个商品只能出现一次（unique_list_product）
+        if item_count > user_count * product_count:
+            raise CommandError('--items cannot exceed --users * --products.')
+        self.stdout.write('Seeding benchmark data...')
+        rng = random.Random(42)
+        now = timezone.now()
+        today = now.date()
+
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'{BENCH_PREFIX}{i}', email=f'{BENCH_PREFIX}{i}@example.com')
+             for i in range(user_count)],
+            batch_size=batch_size,
+        )
+        lists = ShoppingList.objects.bulk_create(
+            [ShoppingList(name=f'{BENCH_PREFIX}list', owner=user) for user in users],
+            batch_size=batch_size,
+        )
+
+        vendors = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'{BENCH_PREFIX}vendor_{i}', email=f'{BENCH_PREFIX}vendor_{i}@example.com', is_vendor=True)
+             for i in range(10)]
+        )
+        suppliers = Supplier.objects.bulk_create([Supplier(user=vendor) for vendor in vendors])
+        products = Product.objects.bulk_create(
+            [Product(name=f'{BENCH_PREFIX}product_{i}', category=rng.choice(Product.CATEGORY_CHOICES)[0])
+             for i in range(product_count)],
+            batch_size=batch_size,
+        )
+        ProductSupplier.objects.bulk_create(
+            [ProductSupplier(product=product, supplier=supplier, price=rng.randint(100, 10_000) / 100)
+             for product in products for supplier in suppliers],
+            batch_size=batch_size,
+        )
+        Discount.objects.bulk_create(
+            [Discount(product=product, supplier=rng.choice(suppliers), discount_type='percentage',
+                      discount_value=rng.randint(5, 50),
+                      valid_from=now - timedelta(days=rng.randint(0, 60)),
+                      valid_until=now + timedelta(days=rng.randint(-30, 30)))
+             for product in products for _ in range(5)],
+            batch_size=batch_size,
+        )
+
+        created = 0
+        batch = []
+        # 商品按清单均匀分配，每个清单不放回地抽样，不会出现重复的 (清单, 商品)
+        per_list, extra = divmod(item_count, len(lists))
+        for index, shopping_list in enumerate(lists):
+            for product in rng.sample(products, per_list + (index < extra)):
+                expiration = today + timedelta(days=rng.randint(-60, 60))
+                batch.append(ShoppingItem(
+                    list=shopping_list,
+                    product=product,
+                    expiration_date=expiration,
+                    # 大部分历史商品已经提醒过
+                    reminder_sent=expiration < today or rng.random() < 0.9,
+                ))
+                if len(batch) >= batch_size:
+                    ShoppingItem.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+                    self.stdout.write(f'  {created}/{item_count} items')
+        if batch:
+            ShoppingItem.objects.bulk_create(batch)
+            created += len(batch)
+            self.stdout.write(f'  {created}/{item_count} items')
+
+    def cleanup(self):
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        CustomUser.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark data removed.'))
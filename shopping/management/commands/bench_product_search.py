@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from shopping.models import Product
+from shopping.services.search import product_index, refresh_search_vectors, search_products, uses_postgres_search
+
+BENCH_PREFIX = 'bench_search_'
+WORDS = [
+    'apple', 'banana', 'orange', 'grape', 'mango', 'organic', 'fresh', 'juice', 'milk', 'yogurt',
+    'cheese', 'bread', 'eggs', 'chicken', 'beef', 'salmon', 'shrimp', 'tomato', 'potato', 'carrot',
+    'sauce', 'chili', 'garlic', 'honey', 'chips', 'cookie', 'chocolate', 'lemon', 'lime', 'spinach',
+]
+QUERIES = ['apple', 'org', 'fresh milk', 'choco cookie', 'salmn', 'tomato sauce']
+
+
+class Command(BaseCommand):
+    help = '对比 icontains 和全文检索在不同商品数量下的搜索延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='保留测试数据')
+
+    def handle(self, *args, **options):
+        backend = 'postgres full-text + trigram' if uses_postgres_search() else 'in-memory inverted index'
+        self.stdout.write(f'Search backend: {backend}')
+        rng = random.Random(7)
+
+        try:
+            for size in sorted(options['sizes']):
+                self.seed(size, options['batch_size'], rng)
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {size} products =='))
+                for query in QUERIES:
+                    baseline = self.measure(lambda: self.icontains(query), options['repeat'])
+                    indexed = self.measure(lambda: self.ranked(query), options['repeat'])
+                    self.stdout.write(
+                        f'{query!r:>16}  icontains {baseline:9.2f} ms   search {indexed:9.2f} ms'
+                    )
+        finally:
+            if not options['keep']:
+                Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+                product_index.reset()
+
+    def icontains(self, query):
+        queryset = Product.objects.filter(Q(name__icontains=query) | Q(category__icontains=query))
+        return list(queryset.values_list('pk', flat=True)[:50])
+
+    def ranked(self, query):
+        return list(search_products(Product.objects.all(), query).values_list('pk', flat=True)[:50])
+
+    def measure(self, func, repeat):
+        # 第一次调用会构建内存索引，不计入统计
+        func()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def seed(self, size, batch_size, rng):
+        existing = Product.objects.filter(name__startswith=BENCH_PREFIX).count()
+        categories = [choice for choice, _ in Product.CATEGORY_CHOICES]
+        started = time.perf_counter()
+        while existing < size:
+            count = min(batch_size, size - existing)
+            created = Product.objects.bulk_create([
+                Product(
+                    name=f'{BENCH_PREFIX}{" ".join(rng.sample(WORDS, 3))} {existing + i}',
+                    category=rng.choice(categories),
+                    description=' '.join(rng.sample(WORDS, 6)),
+                )
+                for i in range(count)
+            ])
+            existing += len(created)
+        # bulk_create 不触发信号，统一重建检索数据
+        refresh_search_vectors(Product.objects.filter(name__startswith=BENCH_PREFIX))
+        self.stdout.write(f'Seeded {size} products in {time.perf_counter() - started:.1f}s')
@@ -0,0 +1,159 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import CustomUser
+from shopping import consumers
+from shopping.models import ShoppingList
+from shopping.services.live import group_name
+
+BENCH_PREFIX = 'bench_ws_'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'N 个清单 × M 个订阅者的 WebSocket 推送压测：广播延迟分位数、每秒消息数、每个连接的内存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lists', type=int, default=10)
+        parser.add_argument('--subscribers', type=int, default=50, help='每个清单的连接数')
+        parser.add_argument('--messages', type=int, default=20, help='每个清单推送的 diff 数')
+        parser.add_argument('--interval', type=float, default=0.0, help='两次推送之间的间隔（秒），0 为突发')
+        parser.add_argument('--window', type=float, default=consumers.COALESCE_WINDOW, help='合并窗口（秒）')
+        parser.add_argument('--redis-url', help='使用 channels_redis（如 redis://127.0.0.1:6379/3）代替内存 channel layer，此时缓存也用配置里的 Redis')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        if options['redis_url']:
+            self.bench(options)
+            return
+        # 内存模式完全不依赖 Redis：连接时的权限检查会读缓存版本号，默认缓存也换成进程内缓存
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.bench(options)
+
+    def bench(self, options):
+        layer = self.make_layer(options['redis_url'])
+        previous_layer = channel_layers.set(DEFAULT_CHANNEL_LAYER, layer)
+        previous_window = consumers.COALESCE_WINDOW
+        consumers.COALESCE_WINDOW = options['window']
+
+        user, lists = self.seed(options['lists'])
+        try:
+            # 连接时的权限检查走数据库，必须在导入应用之后、事件循环之外准备好数据
+            from EcoCart.asgi import application
+            token = str(AccessToken.for_user(user))
+            report = asyncio.run(self.run(application, layer, token, [ls.pk for ls in lists], options))
+        finally:
+            consumers.COALESCE_WINDOW = previous_window
+            channel_layers.set(DEFAULT_CHANNEL_LAYER, previous_layer)
+            self.cleanup()
+
+        self.print_report(report, options)
+
+    def make_layer(self, redis_url):
+        if not redis_url:
+            return InMemoryChannelLayer(capacity=10_000)
+        try:
+            from channels_redis.core import RedisChannelLayer
+        except ImportError:
+            raise CommandError('channels_redis is not installed.')
+        return RedisChannelLayer(hosts=[redis_url], capacity=10_000)
+
+    def seed(self, count):
+        user, _ = CustomUser.objects.get_or_create(
+            username=f'{BENCH_PREFIX}user', defaults={'email': f'{BENCH_PREFIX}user@example.com'},
+        )
+        lists = [ShoppingList.objects.create(owner=user, name=f'{BENCH_PREFIX}{i}') for i in range(count)]
+        return user, lists
+
+    def cleanup(self):
+        CustomUser.objects.filter(username=f'{BENCH_PREFIX}user').delete()
+
+    async def run(self, application, layer, token, list_ids, options):
+        subscribers, messages = options['subscribers'], options['messages']
+
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+        communicators = {list_id: [] for list_id in list_ids}
+        connect_started = time.perf_counter()
+        for list_id in list_ids:
+            batch = [
+                WebsocketCommunicator(application, f'/ws/list/{list_id}/?token={token}')
+                for _ in range(subscribers)
+            ]
+            results = await asyncio.gather(*(communicator.connect() for communicator in batch))
+            if not all(connected for connected, _ in results):
+                raise CommandError(f'Could not connect to list {list_id}: {results[0]}')
+            communicators[list_id] = batch
+        connect_seconds = time.perf_counter() - connect_started
+        connected = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        memory = sum(stat.size_diff for stat in connected.compare_to(baseline, 'filename'))
+        connections = len(list_ids) * subscribers
+
+        latencies = []
+        frames = 0
+
+        async def collect(communicator):
+            nonlocal frames
+            received = 0
+            while received < messages:
+                frame = await communicator.receive_json_from(timeout=options['timeout'])
+                now = time.perf_counter()
+                frames += 1
+                for diff in frame['diffs']:
+                    latencies.append(now - diff['sent_at'])
+                    received += 1
+
+        async def publish(list_id):
+            for seq in range(1, messages + 1):
+                # 每个 diff 用不同的 product_id，避免被合并掉
+                diff = {'op': 'updated', 'product_id': seq, 'seq': seq, 'sent_at': time.perf_counter()}
+                await layer.group_send(group_name(list_id), {'type': 'list.diffs', 'diffs': [diff]})
+                if options['interval']:
+                    await asyncio.sleep(options['interval'])
+
+        started = time.perf_counter()
+        collectors = [collect(c) for batch in communicators.values() for c in batch]
+        await asyncio.gather(*collectors, *(publish(list_id) for list_id in list_ids))
+        elapsed = time.perf_counter() - started
+
+        await asyncio.gather(*(c.disconnect() for batch in communicators.values() for c in batch))
+        return {
+            'connections': connections,
+            'connect_seconds': connect_seconds,
+            'memory_per_connection': memory / connections if connections else 0,
+            'delivered': len(latencies),
+            'frames': frames,
+            'elapsed': elapsed,
+            'latencies': latencies,
+        }
+
+    def print_report(self, report, options):
+        backend = 'channels_redis' if options['redis_url'] else 'in-memory'
+        latencies_ms = [latency * 1000 for latency in report['latencies']]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== {options['lists']} lists x {options['subscribers']} subscribers, "
+            f"{options['messages']} diffs per list ({backend} layer, window {options['window'] * 1000:.0f} ms) =="
+        ))
+        self.stdout.write(f"connections        {report['connections']} in {report['connect_seconds']:.2f}s")
+        self.stdout.write(f"memory/connection  {report['memory_per_connection'] / 1024:.1f} KiB (tracemalloc)")
+        self.stdout.write(f"diffs delivered    {report['delivered']} in {report['frames']} frames")
+        self.stdout.write(f"throughput         {report['delivered'] / report['elapsed']:.0f} diffs/s, "
+                          f"{report['frames'] / report['elapsed']:.0f} frames/s")
+        self.stdout.write(
+            f"latency            p50 {percentile(latencies_ms, 50):.1f} ms  p95 {percentile(latencies_ms, 95):.1f} ms  "
+            f"p99 {percentile(latencies_ms, 99):.1f} ms  max {max(latencies_ms, default=0):.1f} ms  "
+            f"mean {statistics.fmean(latencies_ms) if latencies_ms else 0:.1f} ms"
+        )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from shopping.models import Supplier
+from shopping.services.catalogue_import import (
+    CatalogueImport, ImportFormatError, IMPORT_CHUNK_SIZE, detect_format, iter_rows,
+)
+
+
+class Command(BaseCommand):
+    help = '从 CSV / JSONL 文件批量导入商品和某个供应商的报价'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--supplier', required=True, help='供应商 id 或用户名')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='默认按扩展名判断')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        supplier = self.get_supplier(options['supplier'])
+        try:
+            fmt = detect_format(options['path'], options['format'])
+        except ImportFormatError as exc:
+            raise CommandError(str(exc))
+
+        with open(options['path'], 'rb') as stream:
+            importer = CatalogueImport(supplier, chunk_size=options['chunk_size'])
+            for event in importer.run(iter_rows(stream, fmt)):
+                if event['type'] == 'progress':
+                    for error in event['chunk_errors']:
+                        self.stderr.write(f"line {error['line']}: {error['error']}")
+                    self.stdout.write(
+                        f"{event['rows']} rows: {event['products_created']} products created, "
+                        f"{event['offers_created']} offers created, {event['offers_updated']} updated, "
+                        f"{event['errors']} errors"
+                    )
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Imported {event['rows']} rows ({event['errors']} errors)"
+                    ))
+
+    def get_supplier(self, value):
+        suppliers = Supplier.objects.select_related('user')
+        try:
+            if value.isdigit():
+                return suppliers.get(pk=int(value))
+            return suppliers.get(user__username=value)
+        except Supplier.DoesNotExist:
+            raise CommandError(f'Supplier "{value}" does not exist.')
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_effective_prices(apps, schema_editor):
+    ProductSupplier = apps.get_model('shopping', 'ProductSupplier')
+    Discount = apps.get_model('shopping', 'Discount')
+    EffectivePrice = apps.get_model('shopping', 'EffectivePrice')
+    now = timezone.now()
+
+    rows = []
+    for ps in ProductSupplier.objects.all().iterator():
+        discounts = Discount.objects.filter(
+            product_id=ps.product_id, supplier_id=ps.supplier_id, valid_until__gte=now
+        ).order_by('pk')
+        active = None
+        boundaries = []
+        for discount in discounts:
+            if discount.valid_from <= now:
+                active = active or discount
+                boundaries.append(discount.valid_until)
+            else:
+                boundaries.append(discount.valid_from)
+
+        final_price = ps.price
+        if active and active.discount_type == 'percentage':
+            final_price = round(ps.price * (1 - active.discount_value / 100), 2)
+        elif active and active.discount_type == 'fixed':
+            final_price = round(ps.price - active.discount_value, 2)
+
+        rows.append(EffectivePrice(
+            product_supplier_id=ps.pk,
+            product_id=ps.product_id,
+            supplier_id=ps.supplier_id,
+            discount=active,
+            base_price=ps.price,
+            final_price=final_price,
+            in_stock=ps.stock_status == 'in_stock',
+            valid_from=active.valid_from if active else now,
+            valid_until=min(boundaries, default=None),
+        ))
+    EffectivePrice.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0011_remove_product_price_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('final_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('in_stock', models.BooleanField(default=True)),
+                ('valid_from', models.DateTimeField()),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('discount', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shopping.discount')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='shopping.product')),
+                ('product_supplier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='effective_price', to='shopping.productsupplier')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='shopping.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'in_stock', 'final_price'], name='shopping_ef_product_f3cb7f_idx'), models.Index(fields=['valid_until'], name='shopping_ef_valid_u_723b18_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_effective_prices, migrations.RunPython.noop),
+    ]
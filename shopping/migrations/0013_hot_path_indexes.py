@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0012_effectiveprice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discount',
+            index=models.Index(fields=['product', 'supplier', 'valid_until'], name='shop_discount_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsupplier',
+            index=models.Index(fields=['product', 'price'], name='shop_offer_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingitem',
+            index=models.Index(fields=['list', 'expiration_date'], name='shop_item_list_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingitem',
+            index=models.Index(condition=models.Q(('reminder_sent', False)), fields=['expiration_date'], name='shop_item_pending_expiry_idx'),
+        ),
+    ]
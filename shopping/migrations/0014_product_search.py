@@ -0,0 +1,58 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_INDEXES = [
+    django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='shop_product_search_idx'),
+    django.contrib.postgres.indexes.GinIndex(fields=['name'], name='shop_product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # GIN / trigram 索引只在 Postgres 上创建，SQLite 开发环境用内存倒排索引代替
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Product = apps.get_model('shopping', 'Product')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Product, index)
+
+    vector = None
+    for field, weight in (('name', 'A'), ('category', 'B'), ('description', 'C')):
+        part = django.contrib.postgres.search.SearchVector(field, weight=weight, config='simple')
+        vector = part if vector is None else vector + part
+    Product.objects.update(search_vector=vector)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Product = apps.get_model('shopping', 'Product')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Product, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='product', index=index) for index in SEARCH_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_indexes, drop_search_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_affinities(apps, schema_editor):
+    ShoppingItem = apps.get_model('shopping', 'ShoppingItem')
+    UserCategoryAffinity = apps.get_model('shopping', 'UserCategoryAffinity')
+    rows = (
+        ShoppingItem.objects
+        .values('list__owner_id', 'product__category')
+        .annotate(count=Count('id'))
+    )
+    UserCategoryAffinity.objects.bulk_create(
+        [UserCategoryAffinity(user_id=row['list__owner_id'], category=row['product__category'], item_count=row['count'])
+         for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0014_product_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCategoryAffinity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('vegetables', 'Vegetables'), ('fruit', 'Fruit'), ('juice', 'Juice'), ('dairy', 'Dairy'), ('bread_eggs', 'Bread and Eggs'), ('meat', 'Meat'), ('sauces', 'Sauces'), ('seafood', 'Seafood'), ('junkfood', 'Junk Food')], max_length=50)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_affinities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-item_count'], name='shop_affinity_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='unique_user_category_affinity')],
+            },
+        ),
+        migrations.RunPython(backfill_affinities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:05
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_items(apps, schema_editor):
+    """ 同一清单里重复的商品只保留最新的一行（与添加接口“覆盖数量”的语义一致） """
+    ShoppingItem = apps.get_model('shopping', 'ShoppingItem')
+    duplicates = (
+        ShoppingItem.objects.values('list_id', 'product_id')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        ShoppingItem.objects.filter(
+            list_id=row['list_id'], product_id=row['product_id'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0017_dashboard_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shoppingitem',
+            constraint=models.UniqueConstraint(fields=('list', 'product'), name='unique_list_product'),
+        ),
+    ]
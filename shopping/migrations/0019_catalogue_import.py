@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:20
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_offers(apps, schema_editor):
+    """ 同一供应商对同一商品的重复报价只保留最新的一条 """
+    ProductSupplier = apps.get_model('shopping', 'ProductSupplier')
+    duplicates = (
+        ProductSupplier.objects.values('product_id', 'supplier_id')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        ProductSupplier.objects.filter(
+            product_id=row['product_id'], supplier_id=row['supplier_id'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0018_unique_list_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_offers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productsupplier',
+            constraint=models.UniqueConstraint(fields=('product', 'supplier'), name='unique_product_supplier'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'category'], name='shop_product_name_cat_idx'),
+        ),
+    ]
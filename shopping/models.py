@@ -1,6 +1,8 @@
 from datetime import datetime
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 import uuid
 from users.models import CustomUser
 
@@ -30,12 +32,44 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     supplier = models.ManyToManyField(Supplier, through='ProductSupplier')
+    search_vector = SearchVectorField(null=True, editable=False)  # 全文检索，由信号维护
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='shop_product_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='shop_product_name_trgm_idx'),
+            # 批量导入按 (name, category) 匹配已有商品
+            models.Index(fields=['name', 'category'], name='shop_product_name_cat_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
 
+class ProductSupplierQuerySet(models.QuerySet):
+    def with_prices(self):
+        """ 序列化报价时需要的关联：供应商用户名和物化的最终价格 """
+        return self.select_related('supplier__user', 'effective_price__discount')
+
+    def cheapest_for(self, product_ids):
+        """
+        每个商品只保留一条有货、折后价最低的报价，整批商品一条 SQL 完成。
+        final_price 来自物化的 EffectivePrice。
+        """
+        cheapest = (
+            EffectivePrice.objects
+            .filter(product_id=models.OuterRef('product_id'), in_stock=True)
+            .order_by('final_price', 'pk')
+            .values('product_supplier_id')[:1]
+        )
+        return (
+            self.filter(product_id__in=product_ids, pk=models.Subquery(cheapest))
+            .select_related('product', 'supplier__user')
+            .annotate(final_price=models.F('effective_price__final_price'))
+        )
+
+
 class ProductSupplier(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
@@ -46,6 +80,17 @@ class ProductSupplier(models.Model):
         default='in_stock'
     )
 
+    objects = ProductSupplierQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # 每个供应商对同一商品只有一条报价，批量导入靠它做 upsert
+            models.UniqueConstraint(fields=['product', 'supplier'], name='unique_product_supplier'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'price'], name='shop_offer_product_price_idx'),
+        ]
+
     def __str__(self):
         return f'{self.product.name} - {self.supplier.user.username}'
 
@@ -58,10 +103,47 @@ class Discount(models.Model):
     valid_from = models.DateTimeField()  # 开始时间
     valid_until = models.DateTimeField()  # 结束时间
 
+    class Meta:
+        indexes = [
+            # 查询某个报价当前有效的折扣：(product, supplier) 精确匹配 + valid_until 范围
+            models.Index(fields=['product', 'supplier', 'valid_until'], name='shop_discount_active_idx'),
+        ]
+
     def __str__(self):
         return f'{self.product.name} - {self.discount_value} off'
 
 
+class EffectivePrice(models.Model):
+    """ 反范式化的最终价格（原价减去当前折扣），由信号和定时任务维护 """
+    product_supplier = models.OneToOneField(ProductSupplier, on_delete=models.CASCADE, related_name='effective_price')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='effective_prices')
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='effective_prices')
+    discount = models.ForeignKey(Discount, on_delete=models.SET_NULL, null=True, blank=True)  # 当前生效的折扣
+    base_price = models.DecimalField(max_digits=10, decimal_places=2)
+    final_price = models.DecimalField(max_digits=10, decimal_places=2)
+    in_stock = models.BooleanField(default=True)
+    valid_from = models.DateTimeField()  # 当前价格生效时间
+    valid_until = models.DateTimeField(null=True, blank=True)  # 下一次价格变化时间，为空表示长期有效
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'in_stock', 'final_price']),
+            models.Index(fields=['valid_until']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} - {self.supplier_id}: {self.final_price}'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def with_items(self):
+        """ 一次性预取序列化整个清单所需的数据，查询次数与清单长度无关 """
+        return self.prefetch_related(
+            models.Prefetch('shared_with', queryset=CustomUser.objects.only('id')),
+            models.Prefetch('items', queryset=ShoppingItem.objects.with_product()),
+        )
+
+
 class ShoppingList(models.Model):
     name = models.CharField(max_length=255)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='owned_shopping_lists')  # 改为指向自定义用户模型
@@ -70,10 +152,20 @@ class ShoppingList(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     is_shared = models.BooleanField(default=False)  # 控制是否允许公开访问
 
+    objects = ShoppingListQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
 
+class ShoppingItemQuerySet(models.QuerySet):
+    def with_product(self):
+        """ 连同商品和各供应商报价一起取出，供 ShoppingItemSerializer 使用 """
+        return self.select_related('product').prefetch_related(
+            models.Prefetch('product__productsupplier_set', queryset=ProductSupplier.objects.with_prices()),
+        )
+
+
 class ShoppingItem(models.Model):
     list = models.ForeignKey(ShoppingList, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -83,6 +175,35 @@ class ShoppingItem(models.Model):
     expiration_date = models.DateField(null=True, blank=True)  # 过期日期字段
     reminder_sent = models.BooleanField(default=False)  # 是否已发送过期提醒
 
+    objects = ShoppingItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # 同一清单里每个商品只有一行，批量接口靠它做 upsert
+            models.UniqueConstraint(fields=['list', 'product'], name='unique_list_product'),
+        ]
+        indexes = [
+            # 按清单(owner 通过 list 关联)过滤过期时间
+            models.Index(fields=['list', 'expiration_date'], name='shop_item_list_expiry_idx'),
+            # 只索引还没提醒过的商品，过期提醒任务和即将过期列表都走这个
+            models.Index(
+                fields=['expiration_date'],
+                name='shop_item_pending_expiry_idx',
+                condition=models.Q(reminder_sent=False),
+            ),
+        ]
+
+    # 实时推送用：记录从数据库读出时的值，保存时据此判断改了什么
+    TRACKED_FIELDS = ('quantity', 'is_checked', 'expiration_date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
     def __str__(self):
         return self.product.name
         
@@ -93,3 +214,104 @@ class ShoppingItem(models.Model):
         return False
     
 
+
+class UserCategoryAffinity(models.Model):
+    """ 用户在每个分类下的购物项数量，随 ShoppingItem 增删增量更新，每晚全量校准 """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='category_affinities')
+    category = models.CharField(max_length=50, choices=Product.CATEGORY_CHOICES)
+    item_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_user_category_affinity'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-item_count'], name='shop_affinity_top_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.category}: {self.item_count}'
+
+
+class ProductNeighbour(models.Model):
+    """ 离线计算的商品相似度（同一清单共现，余弦归一化），每个商品只保留 top-N """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'neighbour'], name='unique_product_neighbour'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.neighbour_id}: {self.score:.3f}'
+
+
+# ---- 仪表盘统计汇总（每小时增量汇总，按天/按周） ----
+
+class RollupPeriod(models.TextChoices):
+    DAY = 'day', 'Day'
+    WEEK = 'week', 'Week'  # period_start 为周一
+
+
+class RollupWatermark(models.Model):
+    """ 每个数据源已经汇总到的最大 id """
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source}: {self.last_id}'
+
+
+class CategoryRollup(models.Model):
+    """ 每个分类新增的清单项数量 """
+    period = models.CharField(max_length=10, choices=RollupPeriod.choices)
+    period_start = models.DateField()
+    category = models.CharField(max_length=50, choices=Product.CATEGORY_CHOICES)
+    items_added = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'category'], name='unique_category_rollup'),
+        ]
+
+
+class SupplierRollup(models.Model):
+    """ 每个供应商（按汇总时最便宜的有货报价归属）新增的清单项数量 """
+    period = models.CharField(max_length=10, choices=RollupPeriod.choices)
+    period_start = models.DateField()
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='rollups')
+    items_added = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'supplier'], name='unique_supplier_rollup'),
+        ]
+
+
+class ActivityRollup(models.Model):
+    """ 新建清单数、新注册用户数、活跃用户数（当期建过清单或添加过商品的用户） """
+    period = models.CharField(max_length=10, choices=RollupPeriod.choices)
+    period_start = models.DateField()
+    lists_created = models.PositiveIntegerField(default=0)
+    new_users = models.PositiveIntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start'], name='unique_activity_rollup'),
+        ]
+
+
+class DailyActiveUser(models.Model):
+    """ 活跃用户去重用，不能像计数一样直接累加 """
+    day = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='unique_daily_active_user'),
+        ]
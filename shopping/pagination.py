@@ -0,0 +1,40 @@
+from urllib.parse import urlsplit, urlunsplit
+from rest_framework.pagination import CursorPagination
+
+
+class StableCursorPagination(CursorPagination):
+    """
+    游标分页：按有索引的主键排序翻页，深翻页不会像 OFFSET 那样越来越慢。
+    搜索结果按相关度排序，同分时再按主键。
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', '-id')
+        return super().get_ordering(request, queryset, view)
+
+
+PAGE_LINKS = ('next', 'previous')
+
+
+def relative_page_links(data):
+    """
+    分页结果里的 next / previous 是按当前请求的 scheme 和 host 拼出的绝对地址，
+    缓存前只保留路径和查询参数（游标），否则其他域名或 http/https 的请求会拿到别人的链接。
+    """
+    return {
+        key: urlunsplit(('', '', *urlsplit(value)[2:])) if key in PAGE_LINKS and value else value
+        for key, value in data.items()
+    }
+
+
+def absolute_page_links(request, data):
+    """ relative_page_links 的逆操作：按当前请求还原成绝对地址 """
+    return {
+        key: request.build_absolute_uri(value) if key in PAGE_LINKS and value else value
+        for key, value in data.items()
+    }
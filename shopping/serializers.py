@@ -1,11 +1,15 @@
 # shopping/serializers.py
-from datetime import datetime
+import datetime
+from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import ShoppingList, ShoppingItem, Supplier, Product, ProductSupplier, Discount
+from .models import ShoppingList, ShoppingItem, Supplier, Product, ProductSupplier, Discount, RollupPeriod
 from users.serializers import UserSerializer
+from .services.pricing import resolve_price
 User = get_user_model()
 
+DUPLICATE_OFFER_MESSAGE = "你已为该商品设置过价格，不能重复创建。"
+
 
 class SupplierSerializer(serializers.ModelSerializer):
     user = UserSerializer()
@@ -23,6 +27,18 @@ class ProductSupplierSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'supplier', 'supplier_name', 'price', 'stock_status']
         read_only_fields = ['supplier']  # supplier 由后端自动赋值
 
+    def validate(self, attrs):
+        # 每个供应商对同一商品只能有一条报价（unique_product_supplier），提前检查，返回 400 而不是数据库错误
+        request = self.context.get('request')
+        product = attrs.get('product', getattr(self.instance, 'product', None))
+        if request is not None and product is not None:
+            offers = ProductSupplier.objects.filter(product=product, supplier__user=request.user)
+            if self.instance is not None:
+                offers = offers.exclude(pk=self.instance.pk)
+            if offers.exists():
+                raise serializers.ValidationError({'product': DUPLICATE_OFFER_MESSAGE})
+        return attrs
+
 
 class SupplierInfoSerializer(serializers.ModelSerializer):
     supplier_name = serializers.CharField(source='supplier.user.username', read_only=True)
@@ -33,14 +49,14 @@ class SupplierInfoSerializer(serializers.ModelSerializer):
         model = ProductSupplier
         fields = ['supplier_name', 'price', 'stock_status', 'discount', 'final_price']
 
+    def _resolved(self, obj):
+        # get_discount 和 get_final_price 共用一次计算
+        if not hasattr(obj, '_resolved_price'):
+            obj._resolved_price = resolve_price(obj)
+        return obj._resolved_price
+
     def get_discount(self, obj):
-        now = datetime.now()
-        discount = Discount.objects.filter(
-            supplier=obj.supplier,
-            product=obj.product,
-            valid_from__lte=now,
-            valid_until__gte=now
-        ).first()
+        discount, _ = self._resolved(obj)
 
         if discount:
             return {
@@ -51,26 +67,8 @@ class SupplierInfoSerializer(serializers.ModelSerializer):
         return None
 
     def get_final_price(self, obj):
-        base_price = obj.price
-        now = datetime.now()
-        discount = Discount.objects.filter(
-            supplier=obj.supplier,
-            product=obj.product,
-            valid_from__lte=now,
-            valid_until__gte=now
-        ).first()
-
-        if not discount:
-            return str(base_price)
-
-        if discount.discount_type == 'percentage':
-            final = base_price * (1 - discount.discount_value / 100)
-        elif discount.discount_type == 'fixed':
-            final = base_price - discount.discount_value
-        else:
-            final = base_price
-
-        return str(round(final, 2))
+        _, final_price = self._resolved(obj)
+        return str(final_price)
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -109,7 +107,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
         # 检查是否已经为该产品绑定过该供应商
         if ProductSupplier.objects.filter(product=product, supplier=supplier).exists():
-            raise serializers.ValidationError("你已为该商品设置过价格，不能重复创建。")
+            raise serializers.ValidationError(DUPLICATE_OFFER_MESSAGE)
 
         # 创建供应商绑定记录
         ProductSupplier.objects.create(
@@ -152,3 +150,59 @@ class ProductPriceComparisonSerializer(serializers.Serializer):
     lowest_price_supplier = serializers.CharField()
     lowest_price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
+
+# 批量比价请求（一次最多 500 个商品，重复的 id 视为数量累加）
+class BasketPriceRequestSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500
+    )
+
+
+# 批量增/改/删清单项（一次最多 500 个操作）
+class ShoppingItemOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'update', 'remove'])
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    is_checked = serializers.BooleanField(required=False)
+    expiration_date = serializers.DateField(required=False, allow_null=True)
+
+
+class BulkShoppingItemsSerializer(serializers.Serializer):
+    operations = ShoppingItemOperationSerializer(many=True, allow_empty=False, max_length=500)
+
+
+# 供应商批量改价/改库存（一次最多 5000 条）
+class OfferChangeSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    stock_status = serializers.ChoiceField(choices=[('in_stock', 'In Stock'), ('out_of_stock', 'Out of Stock')], required=False)
+
+    def validate(self, attrs):
+        if 'price' not in attrs and 'stock_status' not in attrs:
+            raise serializers.ValidationError("Provide price and/or stock_status.")
+        return attrs
+
+
+class BulkOfferChangeSerializer(serializers.Serializer):
+    offers = OfferChangeSerializer(many=True, allow_empty=False, max_length=5000)
+
+
+class DashboardRangeSerializer(serializers.Serializer):
+    """ 管理员仪表盘的时间范围参数，默认最近 30 天 """
+    MAX_DAYS = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    period = serializers.ChoiceField(choices=RollupPeriod.choices, default=RollupPeriod.DAY)
+
+    def validate(self, attrs):
+        end = attrs.get('end') or timezone.localdate()
+        start = attrs.get('start') or end - datetime.timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError("start must not be after end.")
+        if (end - start).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Date range cannot exceed {self.MAX_DAYS} days.")
+        attrs.update(start=start, end=end)
+        return attrs
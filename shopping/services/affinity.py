@@ -0,0 +1,57 @@
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from shopping.models import ShoppingItem, UserCategoryAffinity
+
+
+def adjust_affinities(deltas):
+    """
+    批量调整用户-分类计数，deltas 为 {(user_id, category): 增量}。
+    先尝试原子地 UPDATE，不存在的行再插入。
+    """
+    for (user_id, category), delta in deltas.items():
+        if not delta:
+            continue
+        rows = UserCategoryAffinity.objects.filter(user_id=user_id, category=category)
+        if rows.update(item_count=Greatest(F('item_count') + delta, 0)) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                UserCategoryAffinity.objects.create(user_id=user_id, category=category, item_count=delta)
+        except IntegrityError:
+            # 并发插入了同一行，改为累加
+            rows.update(item_count=F('item_count') + delta)
+
+
+def top_categories(user_id, limit=1):
+    """ 用户最常买的分类，直接读预计算表 """
+    return list(
+        UserCategoryAffinity.objects
+        .filter(user_id=user_id, item_count__gt=0)
+        .order_by('-item_count', 'category')
+        .values_list('category', flat=True)[:limit]
+    )
+
+
+def rebuild_affinities(user_ids=None):
+    """ 从 ShoppingItem 全量重算（每晚校准增量计数的误差） """
+    items = ShoppingItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(list__owner_id__in=user_ids)
+    counts = Counter({
+        (row['list__owner_id'], row['product__category']): row['count']
+        for row in items.values('list__owner_id', 'product__category').annotate(count=Count('id'))
+    })
+
+    with transaction.atomic():
+        existing = UserCategoryAffinity.objects.all()
+        if user_ids is not None:
+            existing = existing.filter(user_id__in=user_ids)
+        existing.delete()
+        UserCategoryAffinity.objects.bulk_create(
+            [UserCategoryAffinity(user_id=user_id, category=category, item_count=count)
+             for (user_id, category), count in counts.items()],
+            batch_size=1000,
+        )
+    return len(counts)
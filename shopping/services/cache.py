@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+CACHE_TIMEOUT = 60 * 60
+
+# 请求合并（acoalesced_payload）：只有拿到锁的请求重建缓存，其他请求轮询等待结果
+COALESCE_LOCK_TTL = 10
+COALESCE_WAIT = 2.0
+COALESCE_POLL = 0.02
+
+# 版本号作用域：写入时更新版本号，旧版本的缓存自然失效
+CATALOGUE = 'catalogue'
+SUPPLIERS = 'suppliers'
+NEIGHBOURS = 'neighbours'
+
+
+def product_scope(product_id):
+    return f'product:{product_id}'
+
+
+def list_scope(list_id):
+    return f'list:{list_id}'
+
+
+def user_lists_scope(user_id):
+    return f'user-lists:{user_id}'
+
+
+def _version_key(scope):
+    return f'version:{scope}'
+
+
+def _new_version():
+    # 用微秒时间戳作版本号，单调递增
+    return time.time_ns() // 1000
+
+
+def get_version(scope):
+    """ 读取作用域当前版本号，不存在时初始化 """
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(scope):
+    """ get_version 的异步版本，供 async 视图使用 """
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _new_version(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(*scopes):
+    """
+    作用域内的数据发生变化，让对应缓存全部失效。
+    在事务里调用时等提交后再更新版本号：提前更新的话，并发请求会把提交前的旧数据缓存在新版本下，
+    直到下一次写入都不会失效。不在事务里时立即执行。
+    """
+    if scopes:
+        transaction.on_commit(lambda: _set_versions(scopes))
+
+
+def _set_versions(scopes):
+    version = _new_version()
+    cache.set_many({_version_key(scope): version for scope in scopes}, None)
+
+
+def query_fingerprint(request):
+    """ 把查询参数（搜索、分页等）压缩成缓存键的一部分 """
+    params = sorted(request.query_params.lists())
+    return hashlib.md5(repr(params).encode()).hexdigest()
+
+
+def _incr(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 计数器刚好被淘汰，重新开始计数
+        cache.set(key, 1, None)
+
+
+def _payload_key(name, key_parts):
+    return 'payload:' + ':'.join(str(part) for part in (name, *key_parts))
+
+
+def cached_payload(name, key_parts, build, timeout=CACHE_TIMEOUT):
+    """
+    读取缓存的序列化结果，未命中时调用 build() 生成并写入。
+    name 同时用于命中/未命中计数。
+    """
+    key = _payload_key(name, key_parts)
+    data = cache.get(key)
+    if data is not None:
+        _incr(f'stats:{name}:hit')
+        return data
+
+    _incr(f'stats:{name}:miss')
+    data = build()
+    cache.set(key, data, timeout)
+    return data
+
+
+async def _aincr(key):
+    await cache.aadd(key, 0, None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, None)
+
+
+async def acached_payload(name, key_parts, build, timeout=CACHE_TIMEOUT):
+    """ cached_payload 的异步版本，build 为协程函数；与同步版本共用同一份缓存 """
+    key = _payload_key(name, key_parts)
+    data = await cache.aget(key)
+    if data is not None:
+        await _aincr(f'stats:{name}:hit')
+        return data
+
+    await _aincr(f'stats:{name}:miss')
+    data = await build()
+    await cache.aset(key, data, timeout)
+    return data
+
+
+async def acoalesced_payload(name, key_parts, build, timeout=CACHE_TIMEOUT):
+    """
+    同 acached_payload，但同一个键同时未命中时只有拿到锁的请求执行 build()，
+    其他请求在事件循环上轮询它写入的结果（热点键失效时避免缓存击穿）；
+    等待超时（重建失败或太慢）时自己重建。只有 async 版本：同步代码里轮询会占住线程。
+    """
+    key = _payload_key(name, key_parts)
+    data = await cache.aget(key)
+    if data is not None:
+        await _aincr(f'stats:{name}:hit')
+        return data
+
+    lock_key = f'lock:{key}'
+    token = uuid.uuid4().hex
+    acquired = await cache.aadd(lock_key, token, COALESCE_LOCK_TTL)
+    if not acquired:
+        deadline = time.monotonic() + COALESCE_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(COALESCE_POLL)
+            data = await cache.aget(key)
+            if data is not None:
+                await _aincr(f'stats:{name}:coalesced')
+                return data
+
+    await _aincr(f'stats:{name}:miss')
+    try:
+        data = await build()
+        await cache.aset(key, data, timeout)
+    finally:
+        # 只释放自己持有的锁；超时后自己重建的请求不能删掉别人的锁
+        if acquired and await cache.aget(lock_key) == token:
+            await cache.adelete(lock_key)
+    return data
+
+
+def cache_stats(*names):
+    """ 返回各类缓存的命中/未命中次数（coalesced 为等待别人重建后命中的次数） """
+    kinds = ('hit', 'miss', 'coalesced')
+    keys = [f'stats:{name}:{kind}' for name in names for kind in kinds]
+    values = cache.get_many(keys)
+    return {
+        name: {kind: values.get(f'stats:{name}:{kind}', 0) for kind in kinds}
+        for name in names
+    }
+
+
+def conditional_get(request, scopes, build, extra=''):
+    """
+    根据作用域版本号生成 ETag / Last-Modified。
+    客户端带来的 If-None-Match 仍然有效时直接返回 304，不执行 build()（即不跑查询和序列化）。
+    Last-Modified 只精确到秒，同一秒内的修改无法区分，所以不根据 If-Modified-Since 返回 304。
+    """
+    versions = [get_version(scope) for scope in scopes]
+    etag = quote_etag(hashlib.md5(f'{versions}:{extra}'.encode()).hexdigest())
+    last_modified = max(versions) // 1_000_000
+
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    not_modified = etag in etags or '*' in etags
+
+    response = Response(status=status.HTTP_304_NOT_MODIFIED) if not_modified else build()
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,200 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from shopping.models import Product, ProductSupplier
+from shopping.services.cache import bump_version, CATALOGUE, SUPPLIERS
+from shopping.services.pricing import refresh_effective_prices
+from shopping.services.search import refresh_search_vectors
+from shopping.services.suggest import suggest_index
+
+IMPORT_CHUNK_SIZE = 1000
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}
+
+CATEGORIES = {choice for choice, _ in Product.CATEGORY_CHOICES}
+STOCK_STATUSES = {'in_stock', 'out_of_stock'}
+NAME_MAX_LENGTH = Product._meta.get_field('name').max_length
+PRICE_FIELD = ProductSupplier._meta.get_field('price')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename, declared=None):
+    """ 优先使用显式指定的格式，否则看扩展名 """
+    key = (declared or filename.rsplit('.', 1)[-1]).lower()
+    if key not in FORMATS:
+        raise ImportFormatError("Unsupported format, use csv or jsonl.")
+    return FORMATS[key]
+
+
+def iter_rows(stream, fmt):
+    """
+    逐行解析二进制文件流，产出 (行号, dict 或 None, 错误信息)，
+    不会把整个文件读进内存。
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, "Invalid JSON."
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Each line must be a JSON object."
+            continue
+        yield line_number, row, None
+
+
+def clean_row(row):
+    """ 校验一行数据，返回 (清洗后的数据, 错误信息)；逐行用 DRF serializer 太慢 """
+    name = str(row.get('name') or '').strip()
+    if not name:
+        return None, "name is required."
+    if len(name) > NAME_MAX_LENGTH:
+        return None, f"name is longer than {NAME_MAX_LENGTH} characters."
+
+    category = str(row.get('category') or '').strip()
+    if category not in CATEGORIES:
+        return None, f'"{category}" is not a valid category.'
+
+    try:
+        price = Decimal(str(row.get('price')).strip())
+    except (InvalidOperation, ValueError):
+        return None, "price must be a number."
+    if not price.is_finite() or price < 0:
+        return None, "price must be a non-negative number."
+    price = price.quantize(Decimal(1).scaleb(-PRICE_FIELD.decimal_places))
+    if len(price.as_tuple().digits) > PRICE_FIELD.max_digits:
+        return None, "price is too large."
+
+    stock_status = str(row.get('stock_status') or 'in_stock').strip()
+    if stock_status not in STOCK_STATUSES:
+        return None, f'"{stock_status}" is not a valid stock_status.'
+
+    return {
+        'name': name,
+        'category': category,
+        'description': str(row.get('description') or ''),
+        'price': price,
+        'stock_status': stock_status,
+    }, None
+
+
+class CatalogueImport:
+    """
+    供应商批量导入商品和报价。按块处理：每块一次查询匹配已有商品 (name, category)，
+    bulk_create 新商品，报价按 (product, supplier) upsert，每块一个事务。
+    批量写入不触发信号，物化价格和检索数据按块刷新，缓存和联想索引在结束时统一失效一次。
+    """
+
+    def __init__(self, supplier, chunk_size=IMPORT_CHUNK_SIZE):
+        self.supplier = supplier
+        self.chunk_size = chunk_size
+        self.totals = {'rows': 0, 'products_created': 0, 'offers_created': 0, 'offers_updated': 0, 'errors': 0}
+
+    def run(self, rows):
+        """ 生成器：每处理完一块产出一次进度（含该块的错误），最后产出汇总 """
+        chunk = []
+        try:
+            for line_number, row, error in rows:
+                self.totals['rows'] += 1
+                chunk.append((line_number, row, error))
+                if len(chunk) >= self.chunk_size:
+                    yield self._process(chunk)
+                    chunk = []
+            if chunk:
+                yield self._process(chunk)
+        finally:
+            # 中途失败时已经提交的块也要失效
+            self._invalidate()
+        yield {'type': 'summary', **self.totals}
+
+    def _process(self, chunk):
+        errors = []
+        offers = {}
+        for line_number, row, error in chunk:
+            cleaned = None
+            if error is None:
+                cleaned, error = clean_row(row)
+            if error:
+                errors.append({'line': line_number, 'error': error})
+                continue
+            # 同一块里重复的商品以最后一行为准
+            offers[cleaned['name'], cleaned['category']] = cleaned
+
+        created = self._write(offers) if offers else {'products_created': 0, 'offers_created': 0, 'offers_updated': 0}
+        for key, value in created.items():
+            self.totals[key] += value
+        self.totals['errors'] += len(errors)
+        return {'type': 'progress', **self.totals, 'chunk_errors': errors}
+
+    def _write(self, offers):
+        now = timezone.now()
+        with transaction.atomic():
+            product_ids = {}
+            existing = (
+                Product.objects
+                .filter(name__in={name for name, _ in offers})
+                .order_by('pk')
+                .values_list('pk', 'name', 'category')
+            )
+            for pk, name, category in existing:
+                product_ids.setdefault((name, category), pk)
+
+            new_products = Product.objects.bulk_create([
+                Product(name=row['name'], category=row['category'], description=row['description'])
+                for key, row in offers.items() if key not in product_ids
+            ])
+            for product in new_products:
+                product_ids[product.name, product.category] = product.pk
+            # 按名称查出来的可能有其他分类的同名商品，只保留本块用到的
+            product_ids = {key: product_ids[key] for key in offers}
+
+            existing_offers = set(
+                ProductSupplier.objects
+                .filter(supplier=self.supplier, product_id__in=product_ids.values())
+                .values_list('product_id', flat=True)
+            )
+            ProductSupplier.objects.bulk_create(
+                [
+                    ProductSupplier(
+                        product_id=product_ids[key], supplier=self.supplier,
+                        price=row['price'], stock_status=row['stock_status'],
+                    )
+                    for key, row in offers.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['product', 'supplier'],
+                update_fields=['price', 'stock_status'],
+            )
+            refresh_effective_prices(
+                ProductSupplier.objects.filter(supplier=self.supplier, product_id__in=product_ids.values()),
+                now=now,
+            )
+            if new_products:
+                refresh_search_vectors(Product.objects.filter(pk__in=[product.pk for product in new_products]))
+
+        return {
+            'products_created': len(new_products),
+            'offers_created': len(offers) - len(existing_offers),
+            'offers_updated': len(existing_offers),
+        }
+
+    def _invalidate(self):
+        if self.totals['products_created']:
+            suggest_index.invalidate()
+        if self.totals['products_created'] or self.totals['offers_created'] or self.totals['offers_updated']:
+            # 商品详情的缓存键包含 SUPPLIERS 版本，一次失效所有商品，不用逐个更新 product scope
+            bump_version(CATALOGUE, SUPPLIERS)
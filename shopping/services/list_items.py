@@ -0,0 +1,155 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from shopping.models import Product, ShoppingItem
+from shopping.services import popularity, live
+from shopping.services.affinity import adjust_affinities
+from shopping.services.cache import bump_version, list_scope, user_lists_scope
+
+ADD, UPDATE, REMOVE = 'add', 'update', 'remove'
+UPDATABLE_FIELDS = ('quantity', 'is_checked', 'expiration_date')
+
+# 批量接口自己统一调用 after_items_changed，期间跳过逐项的信号处理
+_handled_in_bulk = ContextVar('handled_in_bulk', default=False)
+
+
+@contextmanager
+def items_handled_in_bulk():
+    token = _handled_in_bulk.set(True)
+    try:
+        yield
+    finally:
+        _handled_in_bulk.reset(token)
+
+
+def handled_in_bulk():
+    return _handled_in_bulk.get()
+
+
+def _result(index, operation, status, detail=None):
+    result = {'index': index, 'op': operation['op'], 'product_id': operation['product_id'], 'status': status}
+    if detail:
+        result['detail'] = detail
+    return result
+
+
+def apply_item_operations(shopping_list, operations):
+    """
+    在一个事务里批量增/改/删清单项，返回每个操作的结果。
+    商品一次查询校验；新增走 bulk_create 的 upsert，修改走 bulk_update，删除用一次 QuerySet.delete()。
+    缓存、分类偏好、热度计数和实时推送在这里通过 after_items_changed 统一处理一次，
+    删除时的逐项信号处理被跳过。
+    """
+    results = [None] * len(operations)
+    product_ids = {operation['product_id'] for operation in operations}
+    categories = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'category'))
+
+    with transaction.atomic():
+        existing = {
+            item.product_id: item
+            for item in ShoppingItem.objects.select_for_update().filter(list=shopping_list, product_id__in=product_ids)
+        }
+
+        seen = set()
+        upserts, updates, removals = {}, {}, {}
+        for index, operation in enumerate(operations):
+            product_id = operation['product_id']
+            if product_id in seen:
+                results[index] = _result(index, operation, 'error', "Duplicate product in request.")
+                continue
+            seen.add(product_id)
+
+            if product_id not in categories:
+                results[index] = _result(index, operation, 'error', "Product not found.")
+            elif operation['op'] == ADD:
+                # 与单个添加接口一致：覆盖数量和过期日期，重置勾选状态
+                upserts[index] = ShoppingItem(
+                    list=shopping_list,
+                    product_id=product_id,
+                    quantity=operation.get('quantity', 1),
+                    is_checked=False,
+                    expiration_date=operation.get('expiration_date'),
+                )
+            elif product_id not in existing:
+                results[index] = _result(index, operation, 'error', "Product not found in shopping list.")
+            elif operation['op'] == UPDATE:
+                item = existing[product_id]
+                for field in UPDATABLE_FIELDS:
+                    if field in operation:
+                        setattr(item, field, operation[field])
+                updates[index] = item
+            else:
+                removals[index] = existing[product_id]
+
+        if upserts:
+            ShoppingItem.objects.bulk_create(
+                upserts.values(),
+                update_conflicts=True,
+                unique_fields=['list', 'product'],
+                update_fields=['quantity', 'is_checked', 'expiration_date'],
+            )
+        if updates:
+            ShoppingItem.objects.bulk_update(updates.values(), UPDATABLE_FIELDS)
+        if removals:
+            with items_handled_in_bulk():
+                ShoppingItem.objects.filter(pk__in=[item.pk for item in removals.values()]).delete()
+
+        if upserts or updates or removals:
+            # 所有变化合并成一次推送
+            diffs = [
+                live.item_diff(item, live.ADDED if item.product_id not in existing else live.UPDATED)
+                for item in upserts.values()
+            ]
+            for item in updates.values():
+                op = live.change_op(item)
+                if op is not None:
+                    diffs.append(live.item_diff(item, op))
+            diffs += [live.item_diff(item, live.REMOVED) for item in removals.values()]
+            after_items_changed(
+                shopping_list.pk,
+                shopping_list.owner_id,
+                created=[
+                    (item.product_id, categories[item.product_id])
+                    for item in upserts.values() if item.product_id not in existing
+                ],
+                removed=[(item.product_id, categories[item.product_id]) for item in removals.values()],
+                diffs=diffs,
+            )
+
+    for index, item in upserts.items():
+        status = 'updated' if item.product_id in existing else 'created'
+        results[index] = _result(index, operations[index], status)
+    for index in updates:
+        results[index] = _result(index, operations[index], 'updated')
+    for index in removals:
+        results[index] = _result(index, operations[index], 'removed')
+    return results
+
+
+def after_items_changed(list_id, owner_id, created=(), removed=(), diffs=()):
+    """
+    清单项变化后的统一处理，单个保存（信号）和批量接口都走这里：
+    缓存版本、用户分类偏好、热度计数、实时推送。created / removed 为 (商品 id, 分类) 列表。
+    缓存版本、热度计数和推送都在事务提交后执行，回滚的写入不计数也不推送；
+    版本号先于推送更新，客户端收到推送后重新拉取拿到的是新数据。
+    """
+    scopes = [list_scope(list_id)]
+    if owner_id is not None:
+        scopes.append(user_lists_scope(owner_id))
+    bump_version(*scopes)
+
+    if owner_id is not None:
+        deltas = Counter()
+        for _, category in created:
+            deltas[owner_id, category] += 1
+        for _, category in removed:
+            deltas[owner_id, category] -= 1
+        adjust_affinities({key: delta for key, delta in deltas.items() if key[1]})
+
+    if created or removed:
+        added_ids = [product_id for product_id, _ in created]
+        removed_ids = [product_id for product_id, _ in removed]
+        transaction.on_commit(lambda: popularity.record_items_changed(added_ids, removed_ids, owner_id))
+
+    live.publish_on_commit(list_id, list(diffs))
@@ -0,0 +1,118 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from shopping.models import ShoppingList
+from shopping.services.cache import get_version, list_scope
+
+logger = logging.getLogger(__name__)
+
+# 每个清单一个递增序号；最近的 diff 留在缓存里，断线重连的客户端从序号续传
+DIFF_TTL = 60 * 60
+MAX_RESUME = 500
+MEMBERSHIP_TTL = 60 * 10
+
+ADDED, UPDATED, CHECKED, REMOVED = 'added', 'updated', 'checked', 'removed'
+
+
+def group_name(list_id):
+    return f'shopping_list_{list_id}'
+
+
+def _seq_key(list_id):
+    return f'live:seq:{list_id}'
+
+
+def _diff_key(list_id, seq):
+    return f'live:diff:{list_id}:{seq}'
+
+
+def can_subscribe(list_id, user_id):
+    """
+    清单的 owner 或被共享的用户才能订阅。结果按清单版本号缓存，
+    清单修改、共享名单变化时版本号更新，缓存自动失效。
+    """
+    key = f'live:member:{list_id}:{user_id}:{get_version(list_scope(list_id))}'
+    allowed = cache.get(key)
+    if allowed is None:
+        allowed = ShoppingList.objects.filter(
+            Q(owner_id=user_id) | Q(shared_with=user_id), pk=list_id,
+        ).exists()
+        cache.set(key, allowed, MEMBERSHIP_TTL)
+    return allowed
+
+
+def change_op(item, created=False):
+    """ 根据 from_db 记录的原值判断变化类型，没有任何变化时返回 None """
+    if created:
+        return ADDED
+    loaded = getattr(item, '_loaded_values', None)
+    if not loaded or len(loaded) < len(item.TRACKED_FIELDS):
+        return UPDATED
+    changed = {name for name, value in loaded.items() if getattr(item, name) != value}
+    if not changed:
+        return None
+    return CHECKED if changed == {'is_checked'} else UPDATED
+
+
+def item_diff(item, op):
+    """ 精简的 diff，清单里每个商品只有一行，客户端按 product_id 合并 """
+    diff = {'op': op, 'product_id': item.product_id}
+    if item.pk is not None:
+        diff['id'] = item.pk
+    if op != REMOVED:
+        diff.update(
+            quantity=item.quantity,
+            is_checked=item.is_checked,
+            expiration_date=item.expiration_date.isoformat() if item.expiration_date else None,
+        )
+    # 同一个对象再次保存时和这次的值比较
+    item._loaded_values = {name: getattr(item, name) for name in item.TRACKED_FIELDS}
+    return diff
+
+
+def publish_diffs(list_id, diffs):
+    """ 分配序号、写入续传日志，并一次性推送给连接这个清单的客户端 """
+    if not diffs:
+        return
+    cache.add(_seq_key(list_id), 0, None)
+    last_seq = cache.incr(_seq_key(list_id), len(diffs))
+    first_seq = last_seq - len(diffs) + 1
+    for seq, diff in enumerate(diffs, start=first_seq):
+        diff['seq'] = seq
+    cache.set_many({_diff_key(list_id, diff['seq']): diff for diff in diffs}, DIFF_TTL)
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group_name(list_id), {'type': 'list.diffs', 'diffs': diffs})
+    except Exception:
+        # 推送只是尽力而为，客户端可以凭序号续传补齐
+        logger.warning('Failed to publish diffs for shopping list %s', list_id, exc_info=True)
+
+
+def publish_on_commit(list_id, diffs):
+    """ 事务提交后再推送，回滚的修改不会发出去 """
+    if diffs:
+        transaction.on_commit(lambda: publish_diffs(list_id, diffs))
+
+
+async def diffs_since(list_id, since):
+    """
+    续传：返回 (当前序号, since 之后的 diff)。
+    落后太多或者日志已过期时 diff 为 None，客户端需要重新拉取整个清单。
+    """
+    current = await cache.aget(_seq_key(list_id), 0)
+    if since == current:
+        return current, []
+    # since 比当前序号还大说明计数器被清空过
+    if since < 0 or since > current or current - since > MAX_RESUME:
+        return current, None
+    keys = [_diff_key(list_id, seq) for seq in range(since + 1, current + 1)]
+    found = await cache.aget_many(keys)
+    if len(found) < len(keys):
+        return current, None
+    return current, [found[key] for key in keys]
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.utils import timezone
+from shopping.models import ProductSupplier
+from shopping.services.cache import bump_version, product_scope, CATALOGUE
+from shopping.services.pricing import refresh_effective_prices
+
+OFFER_FIELDS = ('price', 'stock_status')
+
+
+def bulk_update_offers(supplier, changes):
+    """
+    供应商批量改价/改库存：一个事务里 bulk_update，物化价格一次重算，
+    缓存版本一次性失效（不像逐行 save 那样每行触发一次信号）。
+    changes 为 [{'product': id, 'price': ..., 'stock_status': ...}]，返回 (更新条数, 错误列表)。
+    """
+    errors = []
+    with transaction.atomic():
+        offers = {
+            offer.product_id: offer
+            for offer in ProductSupplier.objects.select_for_update().filter(
+                supplier=supplier, product_id__in={change['product'] for change in changes},
+            )
+        }
+        changed = {}
+        for index, change in enumerate(changes):
+            offer = offers.get(change['product'])
+            if offer is None:
+                errors.append({'index': index, 'product': change['product'], 'detail': "You do not supply this product."})
+                continue
+            for field in OFFER_FIELDS:
+                if field in change:
+                    setattr(offer, field, change[field])
+            changed[offer.product_id] = offer
+
+        if changed:
+            ProductSupplier.objects.bulk_update(changed.values(), OFFER_FIELDS, batch_size=1000)
+            refresh_effective_prices(changed.values(), now=timezone.now())
+            bump_version(CATALOGUE, *(product_scope(product_id) for product_id in changed))
+    return len(changed), errors
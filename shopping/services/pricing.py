@@ -0,0 +1,186 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Prefetch
+from django.utils import timezone
+from shopping.models import Discount, ProductSupplier, EffectivePrice
+
+
+def product_offers_prefetches(prefix=''):
+    """
+    商品列表需要的预取：供应商报价，连同 supplier.user 和物化的最终价格一起取出。
+    prefix 用于嵌套场景，例如 'items__product__'。
+    """
+    return [
+        Prefetch(
+            f'{prefix}productsupplier_set',
+            queryset=ProductSupplier.objects.with_prices(),
+        ),
+    ]
+
+
+def apply_discount(base_price, discount):
+    """ 根据折扣计算最终价格 """
+    if not discount:
+        return base_price
+
+    if discount.discount_type == 'percentage':
+        final = base_price * (1 - discount.discount_value / 100)
+    elif discount.discount_type == 'fixed':
+        final = base_price - discount.discount_value
+    else:
+        final = base_price
+
+    return round(final, 2)
+
+
+def get_active_discount(product_supplier, now=None):
+    """ 直接查库找出该报价当前生效的折扣（没有物化价格时的兜底） """
+    now = now or timezone.now()
+    return Discount.objects.filter(
+        supplier_id=product_supplier.supplier_id,
+        product_id=product_supplier.product_id,
+        valid_from__lte=now,
+        valid_until__gte=now
+    ).order_by('pk').first()
+
+
+def resolve_price(product_supplier, now=None):
+    """
+    返回 (折扣, 最终价格)。
+    优先读取已经 select_related 的 EffectivePrice，行不存在或已过有效期时才现算。
+    """
+    now = now or timezone.now()
+    try:
+        effective = product_supplier.effective_price
+    except EffectivePrice.DoesNotExist:
+        effective = None
+
+    if effective and (effective.valid_until is None or effective.valid_until > now):
+        return effective.discount, effective.final_price
+
+    discount = get_active_discount(product_supplier, now=now)
+    return discount, apply_discount(product_supplier.price, discount)
+
+
+def _price_window(discounts, now):
+    """ 从按 pk 排序的折扣中挑出当前生效的一个，并算出下一次价格可能变化的时间 """
+    active = None
+    boundaries = []
+    for discount in discounts:
+        if discount.valid_from <= now <= discount.valid_until:
+            if active is None:
+                active = discount
+            boundaries.append(discount.valid_until)
+        elif discount.valid_from > now:
+            boundaries.append(discount.valid_from)
+    return active, min(boundaries, default=None)
+
+
+def refresh_effective_prices(product_suppliers, now=None):
+    """
+    批量重算给定报价的最终价格并写回 EffectivePrice，
+    折扣只查一次，返回写入的行。
+    """
+    now = now or timezone.now()
+    product_suppliers = list(product_suppliers)
+    if not product_suppliers:
+        return []
+
+    discounts = defaultdict(list)
+    for discount in Discount.objects.filter(
+        product_id__in={ps.product_id for ps in product_suppliers},
+        supplier_id__in={ps.supplier_id for ps in product_suppliers},
+        valid_until__gte=now,
+    ).order_by('pk'):
+        discounts[(discount.product_id, discount.supplier_id)].append(discount)
+
+    rows = []
+    for ps in product_suppliers:
+        discount, valid_until = _price_window(discounts[(ps.product_id, ps.supplier_id)], now)
+        rows.append(EffectivePrice(
+            product_supplier_id=ps.pk,
+            product_id=ps.product_id,
+            supplier_id=ps.supplier_id,
+            discount=discount,
+            base_price=ps.price,
+            final_price=apply_discount(ps.price, discount),
+            in_stock=ps.stock_status == 'in_stock',
+            valid_from=discount.valid_from if discount else now,
+            valid_until=valid_until,
+        ))
+
+    return EffectivePrice.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['product_supplier'],
+        update_fields=['product', 'supplier', 'discount', 'base_price', 'final_price',
+                       'in_stock', 'valid_from', 'valid_until'],
+    )
+
+
+def refresh_prices_for(product_id, supplier_id, now=None):
+    """ 重算某个 (商品, 供应商) 组合的最终价格 """
+    return refresh_effective_prices(
+        ProductSupplier.objects.filter(product_id=product_id, supplier_id=supplier_id),
+        now=now,
+    )
+
+
+def price_basket(quantities):
+    """
+    给一篮子商品比价，quantities 为 {product_id: 数量}。
+    所有有货报价一次查出，返回每个商品最便宜的报价、总价，
+    以及能一次买齐全部商品的最便宜单一供应商。
+    """
+    offers = (
+        EffectivePrice.objects
+        .filter(product_id__in=list(quantities), in_stock=True)
+        .select_related('product', 'supplier__user')
+        .order_by('product_id', 'final_price', 'pk')
+    )
+
+    cheapest = {}
+    supplier_totals = defaultdict(Decimal)
+    supplier_coverage = defaultdict(set)
+    supplier_names = {}
+    for offer in offers:
+        quantity = quantities[offer.product_id]
+        cheapest.setdefault(offer.product_id, offer)
+        if offer.product_id not in supplier_coverage[offer.supplier_id]:
+            supplier_coverage[offer.supplier_id].add(offer.product_id)
+            supplier_totals[offer.supplier_id] += offer.final_price * quantity
+            supplier_names[offer.supplier_id] = offer.supplier.user.username
+
+    items = []
+    total = Decimal('0.00')
+    for product_id, offer in cheapest.items():
+        line_total = offer.final_price * quantities[product_id]
+        total += line_total
+        items.append({
+            'product_id': product_id,
+            'product': offer.product.name,
+            'quantity': quantities[product_id],
+            'supplier': offer.supplier.user.username,
+            'unit_price': str(offer.final_price),
+            'line_total': str(line_total),
+        })
+
+    # 只有能供应所有可买到商品的供应商才参与单一供应商比价
+    single_supplier = None
+    full_coverage = [
+        supplier_id for supplier_id, covered in supplier_coverage.items()
+        if len(covered) == len(cheapest)
+    ]
+    if cheapest and full_coverage:
+        best = min(full_coverage, key=lambda supplier_id: (supplier_totals[supplier_id], supplier_id))
+        single_supplier = {
+            'supplier': supplier_names[best],
+            'total': str(supplier_totals[best]),
+        }
+
+    return {
+        'items': items,
+        'total': str(total),
+        'unavailable': [product_id for product_id in quantities if product_id not in cheapest],
+        'cheapest_single_supplier': single_supplier,
+    }
@@ -1,20 +1,128 @@
-from collections import Counter
-from shopping.models import ShoppingItem, Product
-
-def get_user_preferred_categories(user):
-    items = ShoppingItem.objects.filter(user=user).select_related('product__category')
-    categories = [item.product.category for item in items if item.product.category]
-    most_common = Counter(categories).most_common(3)
-    return [cat for cat, _ in most_common]
-
-def recommend_products_by_category(categories):
-    return Product.objects.filter(category__in=categories).order_by('-popularity')[:10]
-
-def recommend_discounted_products():
-    return Product.objects.filter(discount__gt=0).order_by('-discount')[:10]
-
-def get_recommendations_for_user(user):
-    categories = get_user_preferred_categories(user)
-    category_recs = recommend_products_by_category(categories)
-    discount_recs = recommend_discounted_products()
-    return category_recs, discount_recs
+from django.db import transaction
+from shopping.models import ShoppingItem, ProductNeighbour
+from shopping.services.cache import bump_version, NEIGHBOURS
+
+NEIGHBOURS_PER_PRODUCT = 20
+MIN_CO_OCCURRENCE = 2
+
+
+def _list_product_matrix():
+    """
+    所有清单构成的 (清单 × 商品) 0/1 稀疏矩阵，返回 (矩阵, 列号 -> 商品 id)。
+    """
+    import numpy as np
+    from scipy import sparse
+
+    pairs = ShoppingItem.objects.values_list('list_id', 'product_id').distinct().order_by()
+    flat = np.fromiter(
+        (value for pair in pairs.iterator(chunk_size=10000) for value in pair), dtype=np.int64,
+    ).reshape(-1, 2)
+    list_ids, product_ids = flat[:, 0], flat[:, 1]
+
+    _, rows = np.unique(list_ids, return_inverse=True)
+    columns_to_products, columns = np.unique(product_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(int(rows.max()) + 1 if len(rows) else 0, len(columns_to_products)),
+    )
+    return matrix, columns_to_products
+
+
+def build_item_neighbours(top_n=NEIGHBOURS_PER_PRODUCT, min_co_occurrence=MIN_CO_OCCURRENCE):
+    """
+    离线计算商品相似度：共现矩阵 C = XᵀX，按余弦归一化，
+    每个商品保留得分最高的 top_n 个邻居写入 ProductNeighbour。
+    """
+    import numpy as np
+    from scipy import sparse
+
+    matrix, columns_to_products = _list_product_matrix()
+    if matrix.nnz == 0:
+        with transaction.atomic():
+            ProductNeighbour.objects.all().delete()
+        bump_version(NEIGHBOURS)
+        return 0
+
+    co_occurrence = (matrix.T @ matrix).tocsr()
+    co_occurrence.setdiag(0)
+    co_occurrence.data[co_occurrence.data < min_co_occurrence] = 0
+    co_occurrence.eliminate_zeros()
+
+    # 余弦相似度：C_ij / sqrt(n_i * n_j)，n_i 为包含商品 i 的清单数
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    inverse_norm = sparse.diags(1.0 / np.sqrt(np.maximum(counts, 1)))
+    similarity = (inverse_norm @ co_occurrence @ inverse_norm).tocsr()
+
+    neighbours = []
+    for column in range(similarity.shape[0]):
+        start, end = similarity.indptr[column], similarity.indptr[column + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        indices = similarity.indices[start:end]
+        if len(scores) > top_n:
+            best = np.argpartition(-scores, top_n)[:top_n]
+            scores, indices = scores[best], indices[best]
+        product_id = int(columns_to_products[column])
+        for neighbour_column, score in zip(indices, scores):
+            neighbours.append(ProductNeighbour(
+                product_id=product_id,
+                neighbour_id=int(columns_to_products[neighbour_column]),
+                score=float(score),
+            ))
+
+    with transaction.atomic():
+        ProductNeighbour.objects.all().delete()
+        ProductNeighbour.objects.bulk_create(neighbours, batch_size=5000)
+    # 相似度表整体替换，基于它的推荐缓存全部失效
+    bump_version(NEIGHBOURS)
+    return len(neighbours)
+
+
+def score_for_user(user, limit=10):
+    """
+    在线打分：用户历史向量 h（每个商品出现的次数）乘以邻居矩阵 S，
+    score = h · S，排除已买过的商品，返回 [(product_id, score)]。
+    """
+    import numpy as np
+    from scipy import sparse
+
+    history = {}
+    for product_id in ShoppingItem.objects.filter(list__owner_id=user.pk).values_list('product_id', flat=True):
+        history[product_id] = history.get(product_id, 0) + 1
+    if not history:
+        return []
+
+    rows = list(
+        ProductNeighbour.objects
+        .filter(product_id__in=list(history))
+        .values_list('product_id', 'neighbour_id', 'score')
+    )
+    if not rows:
+        return []
+
+    history_ids = list(history)
+    history_index = {product_id: i for i, product_id in enumerate(history_ids)}
+    candidate_ids = sorted({neighbour_id for _, neighbour_id, _ in rows})
+    candidate_index = {product_id: i for i, product_id in enumerate(candidate_ids)}
+
+    neighbour_matrix = sparse.csr_matrix(
+        (
+            np.array([score for _, _, score in rows], dtype=np.float32),
+            (
+                np.array([history_index[product_id] for product_id, _, _ in rows]),
+                np.array([candidate_index[neighbour_id] for _, neighbour_id, _ in rows]),
+            ),
+        ),
+        shape=(len(history_ids), len(candidate_ids)),
+    )
+    weights = np.array([history[product_id] for product_id in history_ids], dtype=np.float32)
+    scores = neighbour_matrix.T @ weights
+
+    # 已经买过的商品不再推荐
+    for product_id in history:
+        if product_id in candidate_index:
+            scores[candidate_index[product_id]] = 0
+
+    ranked = np.argsort(-scores)[:limit]
+    return [(candidate_ids[i], float(scores[i])) for i in ranked if scores[i] > 0]
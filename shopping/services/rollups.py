@@ -0,0 +1,187 @@
+import datetime
+from collections import Counter, defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from shopping.models import (
+    ShoppingItem, ShoppingList, ProductSupplier, RollupPeriod, RollupWatermark,
+    CategoryRollup, SupplierRollup, ActivityRollup, DailyActiveUser,
+)
+from users.models import CustomUser
+
+ROLLUP_BATCH = 5000
+# 只汇总若干分钟之前的数据，给还没提交的事务留出时间，避免 id 跳过
+SETTLE_DELAY = datetime.timedelta(minutes=5)
+
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def _periods(day):
+    return ((RollupPeriod.DAY, day), (RollupPeriod.WEEK, week_start(day)))
+
+
+def _increment(model, lookup, field, delta):
+    """ 先原子地 UPDATE，不存在再插入（与 adjust_affinities 相同的做法） """
+    rows = model.objects.filter(**lookup)
+    if rows.update(**{field: F(field) + delta}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **{field: delta})
+    except IntegrityError:
+        rows.update(**{field: F(field) + delta})
+
+
+def _next_batch(source, queryset, time_field, cutoff):
+    """ 锁住水位线，返回本批的 (水位线, 上界 id, 行数)，没有新数据时上界为 None """
+    watermark, _ = RollupWatermark.objects.get_or_create(source=source)
+    watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+    ids = list(
+        queryset.filter(pk__gt=watermark.last_id, **{f'{time_field}__lt': cutoff})
+        .order_by('pk').values_list('pk', flat=True)[:ROLLUP_BATCH]
+    )
+    return watermark, (ids[-1] if ids else None), len(ids)
+
+
+def _daily(queryset, time_field, *fields):
+    return queryset.annotate(day=TruncDate(time_field)).values_list('day', *fields).annotate(count=Count('pk')).order_by()
+
+
+def _mark_active(pairs):
+    """ 记录 (day, user_id)，返回涉及到的日期 """
+    DailyActiveUser.objects.bulk_create(
+        [DailyActiveUser(day=day, user_id=user_id) for day, user_id in pairs],
+        ignore_conflicts=True,
+    )
+    return {day for day, _ in pairs}
+
+
+def _roll_items(watermark, upper):
+    batch = ShoppingItem.objects.filter(pk__gt=watermark.last_id, pk__lte=upper)
+
+    categories = Counter()
+    for day, category, count in _daily(batch, 'created_at', 'product__category'):
+        for period, start in _periods(day):
+            categories[period, start, category] += count
+    for (period, start, category), count in categories.items():
+        _increment(CategoryRollup, {'period': period, 'period_start': start, 'category': category}, 'items_added', count)
+
+    # 供应商归属：商品当前最便宜的有货报价
+    per_product = list(_daily(batch, 'created_at', 'product_id'))
+    cheapest = dict(
+        ProductSupplier.objects.cheapest_for({product_id for _, product_id, _ in per_product})
+        .values_list('product_id', 'supplier_id')
+    )
+    suppliers = Counter()
+    for day, product_id, count in per_product:
+        supplier_id = cheapest.get(product_id)
+        if supplier_id is None:
+            continue
+        for period, start in _periods(day):
+            suppliers[period, start, supplier_id] += count
+    for (period, start, supplier_id), count in suppliers.items():
+        _increment(SupplierRollup, {'period': period, 'period_start': start, 'supplier_id': supplier_id}, 'items_added', count)
+
+    owners = batch.annotate(day=TruncDate('created_at')).values_list('day', 'list__owner_id').distinct().order_by()
+    return _mark_active(list(owners))
+
+
+def _roll_lists(watermark, upper):
+    batch = ShoppingList.objects.filter(pk__gt=watermark.last_id, pk__lte=upper)
+    for day, count in _daily(batch, 'created_at'):
+        for period, start in _periods(day):
+            _increment(ActivityRollup, {'period': period, 'period_start': start}, 'lists_created', count)
+    owners = batch.annotate(day=TruncDate('created_at')).values_list('day', 'owner_id').distinct().order_by()
+    return _mark_active(list(owners))
+
+
+def _roll_users(watermark, upper):
+    batch = CustomUser.objects.filter(pk__gt=watermark.last_id, pk__lte=upper)
+    for day, count in _daily(batch, 'date_joined'):
+        for period, start in _periods(day):
+            _increment(ActivityRollup, {'period': period, 'period_start': start}, 'new_users', count)
+    return set()
+
+
+SOURCES = (
+    ('shopping_item', ShoppingItem.objects.all(), 'created_at', _roll_items),
+    ('shopping_list', ShoppingList.objects.all(), 'created_at', _roll_lists),
+    ('user', CustomUser.objects.all(), 'date_joined', _roll_users),
+)
+
+
+def _refresh_active_users(days):
+    """ 活跃用户数按 DailyActiveUser 重新计数，只处理本次涉及到的日/周 """
+    periods = defaultdict(set)
+    for day in days:
+        periods[RollupPeriod.DAY].add(day)
+        periods[RollupPeriod.WEEK].add(week_start(day))
+    span = {RollupPeriod.DAY: 1, RollupPeriod.WEEK: 7}
+    for period, starts in periods.items():
+        for start in starts:
+            end = start + datetime.timedelta(days=span[period])
+            active = DailyActiveUser.objects.filter(day__gte=start, day__lt=end).values('user_id').distinct().count()
+            ActivityRollup.objects.update_or_create(
+                period=period, period_start=start, defaults={'active_users': active},
+            )
+
+
+def run_rollups(now=None):
+    """ 从各数据源的水位线开始增量汇总，每批一个事务，中途失败下次从断点继续 """
+    cutoff = (now or timezone.now()) - SETTLE_DELAY
+    processed = Counter()
+    for source, queryset, time_field, roll in SOURCES:
+        while True:
+            with transaction.atomic():
+                watermark, upper, count = _next_batch(source, queryset, time_field, cutoff)
+                if upper is None:
+                    break
+                touched_days = roll(watermark, upper)
+                _refresh_active_users(touched_days)
+                processed[source] += count
+                watermark.last_id = upper
+                watermark.save(update_fields=['last_id', 'updated_at'])
+    return dict(processed)
+
+
+def rollup_report(start, end, period=RollupPeriod.DAY):
+    """ 仪表盘用：[start, end] 范围内的时间序列和分类/供应商合计，只读汇总表 """
+    last_day = end
+    if period == RollupPeriod.WEEK:
+        start = week_start(start)
+        last_day = week_start(end) + datetime.timedelta(days=6)
+    in_range = {'period': period, 'period_start__gte': start, 'period_start__lte': end}
+
+    series = list(
+        ActivityRollup.objects.filter(**in_range)
+        .order_by('period_start')
+        .values('period_start', 'lists_created', 'new_users', 'active_users')
+    )
+    categories = list(
+        CategoryRollup.objects.filter(**in_range)
+        .values('category').annotate(items=Sum('items_added'))
+        .order_by('-items')
+    )
+    suppliers = list(
+        SupplierRollup.objects.filter(**in_range)
+        .values('supplier_id', supplier_name=F('supplier__user__username'))
+        .annotate(items=Sum('items_added'))
+        .order_by('-items')
+    )
+    # 范围内活跃用户去重，不能把每期的数字相加
+    active_users = (
+        DailyActiveUser.objects.filter(day__gte=start, day__lte=last_day).values('user_id').distinct().count()
+    )
+    return {
+        'period': period,
+        'start': start,
+        'end': end,
+        'active_users': active_users,
+        'series': series,
+        'items_by_category': categories,
+        'items_by_supplier': suppliers,
+        'watermarks': dict(RollupWatermark.objects.values_list('source', 'updated_at')),
+    }
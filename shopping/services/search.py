@@ -0,0 +1,205 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from shopping.models import Product
+
+# 商品名可能是中英文混合，不做词干化
+SEARCH_CONFIG = 'simple'
+MAX_FALLBACK_RESULTS = 1000
+
+# 字段权重：名称 > 分类 > 描述
+FIELD_WEIGHTS = (('name', 'A', 1.0), ('category', 'B', 0.4), ('description', 'C', 0.2))
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_expression():
+    from django.contrib.postgres.search import SearchVector
+
+    vector = None
+    for field, weight, _ in FIELD_WEIGHTS:
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def refresh_search_vectors(queryset=None):
+    """ 重算 search_vector（Postgres 才有），批量导入等绕过 save() 的写入之后调用 """
+    if not uses_postgres_search():
+        product_index.reset()
+        return
+    queryset = Product.objects.all() if queryset is None else queryset
+    queryset.update(search_vector=search_vector_expression())
+
+
+def _postgres_search(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+
+    # 每个词都做前缀匹配：'app & jui' -> 'app:* & jui:*'
+    ts_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw', config=SEARCH_CONFIG)
+    return (
+        queryset
+        # 全文匹配走 GIN(search_vector)，拼写错误靠 name 上的 trigram 索引兜底
+        .filter(Q(search_vector=ts_query) | Q(name__trigram_word_similar=query))
+        .annotate(similarity=TrigramWordSimilarity(query, 'name'))
+        .annotate(search_rank=SearchRank('search_vector', ts_query) + F('similarity'))
+        .order_by('-search_rank', '-pk')
+    )
+
+
+class InMemoryProductIndex:
+    """
+    SQLite 开发/测试环境下的倒排索引：token -> {product_id: 权重}。
+    第一次搜索时从数据库构建，之后由 Product 的信号增量维护。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._tokens = []
+        self._documents = {}
+
+    def reset(self):
+        with self._lock:
+            self._postings = None
+            self._tokens = []
+            self._documents = {}
+
+    def _ensure_built(self):
+        if self._postings is not None:
+            return
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        for product in Product.objects.only('id', 'name', 'category', 'description').iterator(chunk_size=2000):
+            self._add(product)
+        self._tokens = sorted(self._postings)
+
+    def _add(self, product):
+        """ 写入倒排表，返回新出现的 token """
+        weights = defaultdict(float)
+        for field, _, weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(product, field)):
+                weights[token] += weight
+        new_tokens = []
+        for token, weight in weights.items():
+            if token not in self._postings:
+                new_tokens.append(token)
+            self._postings[token][product.pk] = weight
+        self._documents[product.pk] = list(weights)
+        return new_tokens
+
+    def _remove(self, product_id):
+        """ 从倒排表删除，返回不再有任何商品的 token """
+        empty_tokens = []
+        for token in self._documents.pop(product_id, []):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+                    empty_tokens.append(token)
+        return empty_tokens
+
+    def _sync_tokens(self, removed, added):
+        """ 增量维护有序 token 列表，避免每次都整体排序 """
+        for token in removed:
+            if token in self._postings:
+                continue
+            position = bisect.bisect_left(self._tokens, token)
+            if position < len(self._tokens) and self._tokens[position] == token:
+                del self._tokens[position]
+        for token in added:
+            position = bisect.bisect_left(self._tokens, token)
+            if position == len(self._tokens) or self._tokens[position] != token:
+                self._tokens.insert(position, token)
+
+    def update(self, product):
+        with self._lock:
+            if self._postings is None:
+                return
+            removed = self._remove(product.pk)
+            added = self._add(product)
+            self._sync_tokens(removed, added)
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._postings is None:
+                return
+            self._sync_tokens(self._remove(product_id), [])
+
+    def _prefix_postings(self, prefix):
+        """ 二分查找所有以 prefix 开头的 token，合并它们的倒排表 """
+        matches = defaultdict(float)
+        position = bisect.bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and self._tokens[position].startswith(prefix):
+            token = self._tokens[position]
+            position += 1
+            # 完整匹配比前缀匹配得分更高
+            boost = 1.0 if token == prefix else 0.5
+            for product_id, weight in self._postings[token].items():
+                matches[product_id] = max(matches[product_id], weight * boost)
+        return matches
+
+    def search(self, query, limit=MAX_FALLBACK_RESULTS):
+        """ 所有词都要命中（AND），返回 [(product_id, 得分)]，按得分降序 """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            self._ensure_built()
+            scores = None
+            for token in tokens:
+                matches = self._prefix_postings(token)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {pid: score + matches[pid] for pid, score in scores.items() if pid in matches}
+                if not scores:
+                    return []
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+
+product_index = InMemoryProductIndex()
+
+
+def _fallback_search(queryset, query):
+    ranked = product_index.search(query)
+    if not ranked:
+        return queryset.none()
+    # 得分的取值很少，按得分分组生成 CASE，避免每个商品一个 WHEN
+    ids_by_score = defaultdict(list)
+    for product_id, score in ranked:
+        ids_by_score[score].append(product_id)
+    rank = Case(
+        *[When(pk__in=ids, then=Value(score)) for score, ids in ids_by_score.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return (
+        queryset
+        .filter(pk__in=[product_id for product_id, _ in ranked])
+        .annotate(search_rank=rank)
+        .order_by('-search_rank', '-pk')
+    )
+
+
+def search_products(queryset, query):
+    """ 按相关度排序的商品搜索，结果带 search_rank 注解 """
+    if uses_postgres_search():
+        return _postgres_search(queryset, query)
+    return _fallback_search(queryset, query)
@@ -0,0 +1,69 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+from shopping.models import ShoppingList
+from shopping.serializers import ShoppingListSerializer
+from shopping.services.cache import acoalesced_payload, aget_version, list_scope, CACHE_TIMEOUT, CATALOGUE
+
+# 公开链接的响应允许反向代理缓存一小段时间；代理无法主动失效，所以时间要短，之后凭 ETag 重新验证
+SHARED_LIST_MAX_AGE = 30
+# 不存在的 uuid 也缓存一会儿，避免被随机 uuid 刷库
+MISSING_TTL = 60
+
+NOT_FOUND = {'status': 404, 'body': JSONRenderer().render({"detail": "List not found or not shared."})}
+
+
+def _id_key(uuid):
+    return f'shared:id:{uuid}'
+
+
+async def alookup_list_id(uuid):
+    """ uuid 不会变，对应的主键长期缓存；不存在时记为 0 """
+    list_id = await cache.aget(_id_key(uuid))
+    if list_id is None:
+        list_id = await ShoppingList.objects.filter(uuid=uuid).values_list('pk', flat=True).afirst() or 0
+        await cache.aset(_id_key(uuid), list_id, CACHE_TIMEOUT if list_id else MISSING_TTL)
+    return list_id
+
+
+def render_shared_list(list_id):
+    """ 序列化并渲染成 JSON 字节，连同 ETag 一起缓存；取消共享或已删除时缓存 404 """
+    shopping_list = ShoppingList.objects.with_items().filter(pk=list_id, is_shared=True).first()
+    if shopping_list is None:
+        return NOT_FOUND
+    body = JSONRenderer().render(ShoppingListSerializer(shopping_list).data)
+    return {'status': 200, 'body': body, 'etag': quote_etag(hashlib.md5(body).hexdigest())}
+
+
+async def ashared_list_entry(uuid):
+    """
+    按清单版本和商品目录版本缓存渲染结果：清单、清单项、共享设置变化会更新清单版本，
+    商品、报价、折扣、供应商变化会更新目录版本。同一个 uuid 同时未命中只重建一次。
+    """
+    list_id = await alookup_list_id(uuid)
+    if not list_id:
+        return NOT_FOUND
+    return await acoalesced_payload(
+        'shared_list',
+        (list_id, await aget_version(list_scope(list_id)), await aget_version(CATALOGUE)),
+        sync_to_async(lambda: render_shared_list(list_id)),
+    )
+
+
+def shared_list_response(request, entry):
+    """ 直接返回缓存的 JSON 字节；带 If-None-Match 且 ETag 未变时返回 304 """
+    if entry['status'] != 200:
+        return HttpResponse(entry['body'], status=entry['status'], content_type='application/json')
+
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if entry['etag'] in etags or '*' in etags:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    patch_cache_control(response, public=True, max_age=SHARED_LIST_MAX_AGE)
+    return response
@@ -0,0 +1,188 @@
+import heapq
+import logging
+import threading
+from django.core.cache import cache
+from shopping.models import Product
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = 10
+
+# 多进程共享：商品名变化写成事件日志放在 Redis，各进程按序号增量回放
+SEQ_KEY = 'suggest:seq'
+EVENT_TTL = 60 * 60 * 24
+MAX_REPLAY = 1000
+
+
+def _event_key(seq):
+    return f'suggest:event:{seq}'
+
+
+def _rank(weight, name):
+    return (-weight, name)
+
+
+class _Node:
+    __slots__ = ('children', 'names', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.names = set()  # 在这个节点结束的名称
+        self.top = []  # 子树中权重最高的 k 个名称，已排好序
+
+
+class PrefixTrie:
+    """
+    前缀树，每个节点预先保存子树里 top-k 的名称，
+    查询只需沿前缀走到对应节点，时间与商品总数无关。
+    名称中每个单词开头都可以作为前缀（"juice" 也能匹配 "Fresh Apple Juice"）。
+    """
+
+    def __init__(self, k=SUGGEST_LIMIT):
+        self.k = k
+        self.root = _Node()
+        self.weights = {}
+
+    @staticmethod
+    def _keys(name):
+        words = name.lower().split()
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    def _path(self, key, create=False):
+        node = self.root
+        path = []
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return path
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def _collect_top(self, node):
+        """ 遍历子树重新计算 top-k（只在删除或权重下降时需要） """
+        names = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            names.update(current.names)
+            stack.extend(current.children.values())
+        return heapq.nsmallest(self.k, names, key=lambda name: _rank(self.weights[name], name))
+
+    def add(self, name, delta=1):
+        """ 调整名称的权重（同名商品的数量），权重降到 0 时删除 """
+        name = name.strip()
+        if not name:
+            return
+        weight = self.weights.get(name, 0) + delta
+        if weight > 0:
+            self.weights[name] = weight
+        else:
+            self.weights.pop(name, None)
+
+        # 先更新所有结束节点，再更新沿途节点的 top-k
+        paths = []
+        for key in self._keys(name):
+            path = self._path(key, create=weight > 0)
+            if weight > 0:
+                path[-1].names.add(name)
+            elif len(path) == len(key):
+                path[-1].names.discard(name)
+            paths.append(path)
+
+        for path in paths:
+            for node in path:
+                if weight > 0 and delta > 0:
+                    top = [entry for entry in node.top if entry != name] + [name]
+                    top.sort(key=lambda entry: _rank(self.weights[entry], entry))
+                    node.top = top[:self.k]
+                elif name in node.top:
+                    node.top = self._collect_top(node)
+
+    def remove(self, name):
+        self.add(name, -self.weights.get(name.strip(), 0))
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        key = ' '.join(prefix.lower().split())
+        if not key:
+            return []
+        path = self._path(key)
+        if len(path) < len(key):
+            return []
+        return path[-1].top[:limit]
+
+
+class SharedSuggestIndex:
+    """
+    每个进程内存里一棵前缀树。服务进程启动时（asgi / wsgi）从数据库构建，
+    之后通过 Redis 里的事件日志同步其他进程的修改，查询不访问数据库。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trie = None
+        self._seq = 0
+
+    def _rebuild(self, seq):
+        trie = PrefixTrie()
+        for name in Product.objects.values_list('name', flat=True).iterator(chunk_size=5000):
+            trie.add(name)
+        self._trie = trie
+        self._seq = seq
+
+    def _sync(self):
+        current = cache.get(SEQ_KEY, 0)
+        if self._trie is None or current < self._seq or current - self._seq > MAX_REPLAY:
+            self._rebuild(current)
+            return
+
+        if current == self._seq:
+            return
+        keys = [_event_key(seq) for seq in range(self._seq + 1, current + 1)]
+        events = cache.get_many(keys)
+        if len(events) < len(keys):
+            # 事件已过期，只能整体重建
+            self._rebuild(current)
+            return
+        for key in keys:
+            old_name, new_name = events[key]
+            if old_name:
+                self._trie.add(old_name, -1)
+            if new_name:
+                self._trie.add(new_name, 1)
+        self._seq = current
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        with self._lock:
+            self._sync()
+            return self._trie.suggest(prefix, limit)
+
+    def warm(self):
+        """ 启动时预先构建，第一个请求不用等；失败时记录日志，留给第一次查询再建 """
+        try:
+            with self._lock:
+                self._sync()
+        except Exception:
+            logger.warning('Could not build the suggest index at startup', exc_info=True)
+
+    def publish(self, old_name, new_name):
+        """ 商品名新增/修改/删除时写入事件日志 """
+        if old_name == new_name:
+            return
+        cache.add(SEQ_KEY, 0, None)
+        seq = cache.incr(SEQ_KEY)
+        cache.set(_event_key(seq), (old_name, new_name), EVENT_TTL)
+
+    def invalidate(self):
+        """ 批量写入绕过了信号时调用，让所有进程下次查询时重建 """
+        cache.add(SEQ_KEY, 0, None)
+        cache.incr(SEQ_KEY, MAX_REPLAY + 1)
+
+    def reset(self):
+        with self._lock:
+            self._trie = None
+
+
+suggest_index = SharedSuggestIndex()
@@ -0,0 +1,223 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from users.models import CustomUser
+from .models import Product, ProductSupplier, Discount, Supplier, ShoppingList, ShoppingItem
+from .services.pricing import refresh_effective_prices, refresh_prices_for
+from .services.search import product_index, refresh_search_vectors, uses_postgres_search
+from .services.suggest import suggest_index
+from .services import popularity, live
+from .services.list_items import after_items_changed, handled_in_bulk
+from .services.cache import bump_version, product_scope, list_scope, user_lists_scope, CATALOGUE, SUPPLIERS
+
+
+def _deleted_directly(origin, model):
+    """ 只处理直接删除的对象；级联删除时报价本身也会被删掉，不需要重算 """
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(post_save, sender=ProductSupplier)
+def refresh_price_on_offer_save(sender, instance, **kwargs):
+    refresh_effective_prices([instance])
+
+
+@receiver(pre_save, sender=ProductSupplier)
+@receiver(pre_save, sender=Discount)
+def remember_previous_pair(sender, instance, update_fields=None, **kwargs):
+    # 报价或折扣可能被改到别的商品 / 供应商上，保存后原来那组也要处理
+    instance._previous_pair = None
+    if update_fields is not None and not {'product', 'product_id', 'supplier', 'supplier_id'} & set(update_fields):
+        return
+    if instance.pk:
+        instance._previous_pair = (
+            sender.objects.filter(pk=instance.pk).values_list('product_id', 'supplier_id').first()
+        )
+
+
+@receiver(post_save, sender=Discount)
+def refresh_price_on_discount_save(sender, instance, **kwargs):
+    refresh_prices_for(instance.product_id, instance.supplier_id)
+    # 折扣换到了别的商品或供应商，原来那组报价的价格也要重算
+    previous = getattr(instance, '_previous_pair', None)
+    if previous and previous != (instance.product_id, instance.supplier_id):
+        refresh_prices_for(*previous)
+
+
+@receiver(post_delete, sender=Discount)
+def refresh_price_on_discount_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(origin, Discount):
+        refresh_prices_for(instance.product_id, instance.supplier_id)
+
+
+# ---- 全文检索 ----
+
+@receiver(post_save, sender=Product)
+def refresh_product_search(sender, instance, **kwargs):
+    if uses_postgres_search():
+        refresh_search_vectors(Product.objects.filter(pk=instance.pk))
+    else:
+        product_index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search(sender, instance, **kwargs):
+    product_index.remove(instance.pk)
+
+
+# ---- 搜索联想 ----
+
+@receiver(pre_save, sender=Product)
+def remember_previous_name(sender, instance, **kwargs):
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = Product.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def publish_name_change(sender, instance, **kwargs):
+    suggest_index.publish(getattr(instance, '_previous_name', None), instance.name)
+
+
+@receiver(post_delete, sender=Product)
+def publish_name_removal(sender, instance, **kwargs):
+    suggest_index.publish(instance.name, None)
+
+
+# ---- 缓存失效 ----
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    bump_version(CATALOGUE, product_scope(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=ProductSupplier)
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_offer_cache(sender, instance, **kwargs):
+    scopes = [CATALOGUE, product_scope(instance.product_id)]
+    previous = getattr(instance, '_previous_pair', None)
+    if previous and previous[0] != instance.product_id:
+        scopes.append(product_scope(previous[0]))
+    bump_version(*scopes)
+
+
+@receiver([post_save, post_delete], sender=Supplier)
+def invalidate_supplier_cache(sender, instance, **kwargs):
+    # 商品数据里也带有供应商名称
+    bump_version(SUPPLIERS, CATALOGUE)
+
+
+# 商品和供应商数据里出现的用户字段（supplier_name，以及 SupplierSerializer 里嵌套的 user）
+VENDOR_DISPLAY_FIELDS = ('username', 'email', 'is_vendor', 'is_admin')
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_vendor_change(sender, instance, update_fields=None, **kwargs):
+    instance._vendor_display_changed = False
+    # 登录时只更新 last_login（update_fields），不需要查库比较
+    if instance.pk is None or (update_fields is not None and not set(update_fields) & set(VENDOR_DISPLAY_FIELDS)):
+        return
+    previous = CustomUser.objects.filter(pk=instance.pk).values(*VENDOR_DISPLAY_FIELDS).first()
+    if previous is not None and (previous['is_vendor'] or instance.is_vendor):
+        instance._vendor_display_changed = any(
+            previous[name] != getattr(instance, name) for name in VENDOR_DISPLAY_FIELDS
+        )
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_vendor_cache(sender, instance, **kwargs):
+    if getattr(instance, '_vendor_display_changed', False):
+        bump_version(SUPPLIERS, CATALOGUE)
+
+
+@receiver([post_save, post_delete], sender=ShoppingList)
+def invalidate_list_cache(sender, instance, **kwargs):
+    bump_version(list_scope(instance.pk), user_lists_scope(instance.owner_id))
+
+
+@receiver(m2m_changed, sender=ShoppingList.shared_with.through)
+def invalidate_shared_list_cache(sender, instance, action, pk_set=None, **kwargs):
+    if action == 'pre_clear' and not isinstance(instance, ShoppingList):
+        # 从用户一侧 clear() 时 post_clear 不带 pk_set，先记下受影响的清单
+        instance._cleared_list_ids = set(instance.shared_shopping_lists.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear' and not isinstance(instance, ShoppingList):
+        pk_set = getattr(instance, '_cleared_list_ids', None)
+    # 清单列表接口（按 user_lists_scope 生成 ETag）里也有 shared_with，owner 的版本号要一起更新；
+    # 列表接口只返回自己拥有的清单，被共享的用户那边不受影响
+    if isinstance(instance, ShoppingList):
+        bump_version(list_scope(instance.pk), user_lists_scope(instance.owner_id))
+    elif pk_set:
+        # 从用户一侧修改（user.shared_shopping_lists.add(...)），pk_set 是清单 id
+        owners = ShoppingList.objects.filter(pk__in=pk_set).values_list('owner_id', flat=True).distinct()
+        bump_version(
+            *(list_scope(list_id) for list_id in pk_set),
+            *(user_lists_scope(owner_id) for owner_id in owners),
+        )
+
+
+def list_owner_id(item):
+    """ 清单项所属清单的 owner，清单已加载时不再查库 """
+    if ShoppingItem.list.is_cached(item):
+        return item.list.owner_id
+    return ShoppingList.objects.filter(pk=item.list_id).values_list('owner_id', flat=True).first()
+
+
+def _item_category(item):
+    if ShoppingItem.product.is_cached(item):
+        return item.product.category
+    return Product.objects.filter(pk=item.product_id).values_list('category', flat=True).first()
+
+
+def _list_deleted(origin):
+    """ 清单本身（或它的 owner）正在被删除，清单项是级联删除的 """
+    model = getattr(origin, 'model', None) or type(origin)
+    return issubclass(model, (ShoppingList, CustomUser))
+
+
+# ---- 清单项变化：缓存失效、分类偏好、热度计数、WebSocket 推送 ----
+# 合并在一个 receiver 里，owner 和分类各最多查一次，具体处理见 after_items_changed
+
+@receiver(post_save, sender=ShoppingItem)
+def handle_item_save(sender, instance, created, **kwargs):
+    op = live.change_op(instance, created)
+    if op is None:
+        # 客户端能看到的字段都没变
+        return
+    after_items_changed(
+        instance.list_id,
+        list_owner_id(instance),
+        created=[(instance.product_id, _item_category(instance))] if created else (),
+        diffs=[live.item_diff(instance, op)],
+    )
+
+
+@receiver(post_delete, sender=ShoppingItem)
+def handle_item_delete(sender, instance, origin=None, **kwargs):
+    if handled_in_bulk() or _list_deleted(origin):
+        # 批量接口或 ShoppingList 的 pre_delete 会一次处理，不逐项查询和推送
+        return
+    after_items_changed(
+        instance.list_id,
+        list_owner_id(instance),
+        removed=[(instance.product_id, _item_category(instance))],
+        diffs=[live.item_diff(instance, live.REMOVED)],
+    )
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def handle_list_delete(sender, instance, **kwargs):
+    """ 删除整个清单：一条查询取出清单项，分类偏好和热度计数批量回退 """
+    removed = list(instance.items.values_list('product_id', 'product__category'))
+    if removed:
+        after_items_changed(instance.pk, instance.owner_id, removed=removed)
+
+
+# ---- 统计计数器（Redis），提交后再写，回滚的写入不计数 ----
+
+@receiver(post_save, sender=ShoppingList)
+def count_active_user(sender, instance, created, **kwargs):
+    if created:
+        owner_id = instance.owner_id
+        transaction.on_commit(lambda: popularity.record_list_created(owner_id))
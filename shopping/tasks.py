@@ -1,31 +1,169 @@
-from celery import shared_task
-from django.core.mail import send_mail
-from datetime import datetime, timedelta
-from .models import ShoppingItem
-from django.contrib.auth.models import User
+import logging
+from celery import shared_task, group, chord
+from itertools import groupby
+from django.core.mail import get_connection, EmailMessage
+from django.db import connection as db_connection
+from django.db.models.functions import Mod
+from datetime import timedelta
+from django.utils import timezone
+from .models import ShoppingItem, ProductSupplier
+from .services.pricing import refresh_effective_prices
+from .services.cache import bump_version, product_scope, CATALOGUE
+from .services.affinity import rebuild_affinities
+from .services.recommendation import build_item_neighbours
+from .services import popularity
+from .services.rollups import run_rollups
 
-@shared_task
-def check_expiring_products():
-    today = datetime.today().date()
-    soon_expiry_date = today + timedelta(days=3)
+REMINDER_CHUNK_SIZE = 500
+REMINDER_SHARDS = 16
+
+logger = logging.getLogger(__name__)
 
-    # 查找即将过期的商品
-    expiring_items = ShoppingItem.objects.filter(
-        expiration_date__lte=soon_expiry_date,
-        expiration_date__gte=today,
-        reminder_sent=False
+
+def _digest_message(user, items):
+    """ 把同一个用户的即将过期商品合并成一封邮件 """
+    lines = [f'- "{item.product.name}" expires on {item.expiration_date}' for item in items]
+    return EmailMessage(
+        'Your products are about to expire!',
+        'The following products will expire soon:\n' + '\n'.join(lines),
+        None,  # 使用默认邮箱
+        [user.email],
     )
 
-    for item in expiring_items:
-        user = item.list.owner
-        # 发送提醒邮件（根据你的需求，可以改为推送通知等）
-        send_mail(
-            'Your product is about to expire!',
-            f'The product "{item.product.name}" will expire on {item.expiration_date}.',
-            None,  # 使用默认邮箱
-            [user.email],
-            fail_silently=False,
+
+def _claim_items(item_ids):
+    """
+    原子地认领还没提醒过的商品（UPDATE ... WHERE reminder_sent=false RETURNING id），
+    已被其他任务或重叠的运行认领的商品不会出现在结果里，因此不会重复发送。
+    """
+    if not item_ids:
+        return set()
+    table = db_connection.ops.quote_name(ShoppingItem._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET reminder_sent = %s '
+            f'WHERE id IN ({placeholders}) AND reminder_sent = %s RETURNING id',
+            [True, *item_ids, False],
         )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _send_digests(mail_connection, batch):
+    """ 先认领再发送；发送失败的用户释放认领，留给重试 """
+    claimed = _claim_items([item.pk for _, items in batch for item in items])
+    sent = failed = 0
+    for user, items in batch:
+        items = [item for item in items if item.pk in claimed]
+        if not items:
+            continue
+        try:
+            mail_connection.send_messages([_digest_message(user, items)])
+            sent += 1
+        except OSError:
+            logger.exception('Failed to send expiry digest to user %s', user.pk)
+            ShoppingItem.objects.filter(pk__in=[item.pk for item in items]).update(reminder_sent=False)
+            failed += 1
+    return sent, failed
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def send_expiry_reminders(shard, shards, chunk_size=REMINDER_CHUNK_SIZE):
+    """ 处理一个用户分片：流式读取、按用户汇总、复用一个 SMTP 连接发送 """
+    today = timezone.now().date()
+    soon_expiry_date = today + timedelta(days=3)
+
+    expiring_items = (
+        ShoppingItem.objects
+        .filter(expiration_date__lte=soon_expiry_date, expiration_date__gte=today, reminder_sent=False)
+        .annotate(owner_shard=Mod('list__owner_id', shards))
+        .filter(owner_shard=shard)
+        .select_related('list__owner', 'product')
+        .order_by('list__owner_id', 'expiration_date', 'pk')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    mail_connection = get_connection(fail_silently=False)
+    mail_connection.open()
+    sent = failed = 0
+    batch, batch_size = [], 0
+    try:
+        # 每个用户一封汇总邮件，攒够一批就认领并发送
+        for _, user_items in groupby(expiring_items, key=lambda item: item.list.owner_id):
+            user_items = list(user_items)
+            batch.append((user_items[0].list.owner, user_items))
+            batch_size += len(user_items)
+
+            if batch_size >= chunk_size:
+                batch_sent, batch_failed = _send_digests(mail_connection, batch)
+                sent, failed = sent + batch_sent, failed + batch_failed
+                batch, batch_size = [], 0
+
+        batch_sent, batch_failed = _send_digests(mail_connection, batch)
+        sent, failed = sent + batch_sent, failed + batch_failed
+    finally:
+        mail_connection.close()
+    return {'shard': shard, 'sent': sent, 'failed': failed}
+
+
+@shared_task
+def aggregate_expiry_reminders(results):
+    """ 汇总各分片的发送结果 """
+    summary = {
+        'shards': len(results),
+        'sent': sum(result['sent'] for result in results),
+        'failed': sum(result['failed'] for result in results),
+    }
+    logger.info('Expiry reminders finished: %s', summary)
+    return summary
 
-        item.reminder_sent = True
-        item.save()
+
+@shared_task
+def check_expiring_products(shards=REMINDER_SHARDS, chunk_size=REMINDER_CHUNK_SIZE):
+    """ 协调任务：按用户哈希分片派发给多个 worker，全部完成后汇总 """
+    header = group(send_expiry_reminders.s(shard, shards, chunk_size) for shard in range(shards))
+    return chord(header)(aggregate_expiry_reminders.s()).id
+
+
+@shared_task
+def flip_effective_prices(batch_size=1000):
+    """ 折扣开始/结束时，重算已经到期的物化价格 """
+    now = timezone.now()
+    stale = ProductSupplier.objects.filter(effective_price__valid_until__lte=now).order_by('pk')
+
+    flipped = 0
+    last_pk = 0
+    while True:
+        batch = list(stale.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        refresh_effective_prices(batch, now=now)
+        # 折扣开始/结束时，缓存的商品数据也要失效
+        bump_version(CATALOGUE, *{product_scope(ps.product_id) for ps in batch})
+        flipped += len(batch)
+        last_pk = batch[-1].pk
+    return flipped
+
+
+@shared_task
+def rebuild_category_affinities():
+    """ 每晚从 ShoppingItem 全量校准用户分类偏好 """
+    return rebuild_affinities()
+
+
+@shared_task
+def build_product_neighbours():
+    """ 每晚根据所有清单的共现关系重建商品相似度 """
+    return build_item_neighbours()
+
+
+@shared_task
+def reconcile_popularity_counters():
+    """ 每晚用数据库重新校准 Redis 里的热度和活跃用户计数 """
+    return popularity.reconcile()
+
+
+@shared_task
+def rollup_dashboard_stats():
+    """ 每小时把新增的清单项、清单、用户增量汇总到仪表盘统计表 """
+    return run_rollups()
@@ -1,3 +1,1285 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import redis
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection, transaction
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import CustomUser
+from .models import (
+    Supplier, Product, ProductSupplier, Discount, EffectivePrice, ShoppingList, ShoppingItem, UserCategoryAffinity,
+    ProductNeighbour, RollupPeriod, RollupWatermark, CategoryRollup, SupplierRollup, ActivityRollup,
+)
+from .serializers import SupplierInfoSerializer, DashboardRangeSerializer
+from .services import popularity
+from .services.cache import bump_version, cache_stats, get_version, CATALOGUE
+from .services.pricing import refresh_effective_prices, resolve_price
+from .services.recommendation import build_item_neighbours, score_for_user
+from .services.rollups import run_rollups
+from .services.suggest import suggest_index
+from .tasks import check_expiring_products, send_expiry_reminders, _claim_items
 
-# Create your tests here.
+
+class ShoppingListQueryCountTests(APITestCase):
+    """ 清单序列化的查询次数不应随清单长度增长 """
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.friend = CustomUser.objects.create_user(username='friend', email='friend@example.com', password='pass')
+        self.suppliers = [
+            Supplier.objects.create(user=CustomUser.objects.create_user(
+                username=f'vendor{i}', email=f'vendor{i}@example.com', password='pass', is_vendor=True))
+            for i in range(3)
+        ]
+        self.client.force_authenticate(self.owner)
+
+    def make_list(self, item_count):
+        shopping_list = ShoppingList.objects.create(name=f'list {item_count}', owner=self.owner, is_shared=True)
+        shopping_list.shared_with.add(self.friend)
+        for i in range(item_count):
+            product = Product.objects.create(name=f'product {item_count}-{i}', category='fruit')
+            for supplier in self.suppliers:
+                ProductSupplier.objects.create(product=product, supplier=supplier, price=10)
+            ShoppingItem.objects.create(list=shopping_list, product=product)
+        return shopping_list
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_shopping_list_detail_query_count_is_constant(self):
+        small = self.make_list(1)
+        large = self.make_list(500)
+        self.assertEqual(
+            self.count_queries(f'/shopping/lists/{small.id}/'),
+            self.count_queries(f'/shopping/lists/{large.id}/'),
+        )
+
+    def test_shared_list_query_count_is_constant(self):
+        small = self.make_list(1)
+        large = self.make_list(500)
+        self.assertEqual(
+            self.count_queries(f'/shopping/list/share/{small.uuid}/'),
+            self.count_queries(f'/shopping/list/share/{large.uuid}/'),
+        )
+
+    def test_user_shopping_lists_query_count_is_constant(self):
+        self.make_list(1)
+        baseline = self.count_queries(f'/users/users/{self.owner.id}/shopping_lists/')
+        self.make_list(30)
+        self.make_list(100)
+        self.assertEqual(baseline, self.count_queries(f'/users/users/{self.owner.id}/shopping_lists/'))
+
+
+class ShoppingListCacheTests(APITestCase):
+    """ 清单接口的 ETag / 304：写入后版本号必须更新，不能返回过期的 304 """
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.friend = CustomUser.objects.create_user(username='friend', email='friend@example.com', password='pass')
+        self.shopping_list = ShoppingList.objects.create(name='weekly', owner=self.owner)
+        self.client.force_authenticate(self.owner)
+
+    def get_lists(self, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/shopping/lists/', headers=headers)
+
+    def assert_changed_after(self, change):
+        etag = self.get_lists()['ETag']
+        self.assertEqual(self.get_lists(etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.get_lists(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_sharing_from_list_side_invalidates_owner_lists(self):
+        response = self.assert_changed_after(lambda: self.shopping_list.shared_with.add(self.friend))
+        self.assertEqual(response.data['results'][0]['shared_with'], [self.friend.pk])
+
+    def test_sharing_from_user_side_invalidates_owner_lists(self):
+        response = self.assert_changed_after(lambda: self.friend.shared_shopping_lists.add(self.shopping_list))
+        self.assertEqual(response.data['results'][0]['shared_with'], [self.friend.pk])
+
+    def test_clearing_from_user_side_invalidates_owner_lists(self):
+        self.shopping_list.shared_with.add(self.friend)
+        response = self.assert_changed_after(lambda: self.friend.shared_shopping_lists.clear())
+        self.assertEqual(response.data['results'][0]['shared_with'], [])
+
+    def test_item_change_invalidates_list_detail(self):
+        url = f'/shopping/lists/{self.shopping_list.pk}/'
+        etag = self.client.get(url)['ETag']
+        product = Product.objects.create(name='apple', category='fruit')
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingItem.objects.create(list=self.shopping_list, product=product)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), 1)
+
+    def test_if_modified_since_alone_never_returns_stale_304(self):
+        # Last-Modified 只精确到秒，同一秒内的修改也必须返回新数据
+        last_modified = self.get_lists()['Last-Modified']
+        self.shopping_list.shared_with.add(self.friend)
+        response = self.client.get('/shopping/lists/', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['shared_with'], [self.friend.pk])
+
+
+class CachedPageLinksTests(APITestCase):
+    """ 缓存的分页结果不能带着第一个请求的 host / scheme """
+
+    def setUp(self):
+        cache.clear()
+        vendor = CustomUser.objects.create_user(username='vendor', email='vendor@example.com', is_vendor=True)
+        Supplier.objects.create(user=vendor)
+        Supplier.objects.create(user=CustomUser.objects.create_user(
+            username='vendor2', email='vendor2@example.com', is_vendor=True))
+        for name in ('apple', 'pear'):
+            Product.objects.create(name=name, category='fruit')
+        self.client.force_authenticate(vendor)
+
+    def assert_links_follow_host(self, url):
+        first = self.client.get(url, {'page_size': 1}, headers={'Host': 'a.example'})
+        self.assertTrue(first.data['next'].startswith('http://a.example/'))
+
+        second = self.client.get(url, {'page_size': 1}, headers={'Host': 'b.example'}, secure=True)
+        self.assertTrue(second.data['next'].startswith('https://b.example/'))
+        self.assertEqual(first.data['results'], second.data['results'])
+
+        # 跟着游标翻页（此时 previous 也有值）
+        page_two = self.client.get(second.data['next'], headers={'Host': 'b.example'}, secure=True)
+        self.assertTrue(page_two.data['previous'].startswith('https://b.example/'))
+        self.assertNotEqual(page_two.data['results'], first.data['results'])
+
+    def test_product_list(self):
+        self.assert_links_follow_host('/shopping/products/')
+        self.assertEqual(cache_stats('products')['products']['hit'], 1)
+
+    def test_supplier_list(self):
+        self.assert_links_follow_host('/shopping/suppliers/')
+        self.assertEqual(cache_stats('suppliers')['suppliers']['hit'], 1)
+
+
+class SharedListCacheTests(APITestCase):
+    """ 公开共享清单：渲染结果缓存、ETag / Cache-Control、写入后失效 """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.shopping_list = ShoppingList.objects.create(name='party', owner=self.owner, is_shared=True)
+        self.product = Product.objects.create(name='chips', category='junkfood')
+        self.url = f'/shopping/list/share/{self.shopping_list.uuid}/'
+
+    def test_response_is_cacheable_and_revalidates(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+    def test_item_write_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingItem.objects.create(list=self.shopping_list, product=self.product)
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items']), 1)
+
+    def test_unsharing_returns_404(self):
+        self.client.get(self.url)
+        self.shopping_list.is_shared = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shopping_list.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_unknown_uuid_returns_404(self):
+        self.assertEqual(self.client.get('/shopping/list/share/00000000-0000-0000-0000-000000000000/').status_code, 404)
+
+
+class CoalescedPayloadTests(TestCase):
+    """ 缓存击穿保护：同一个键同时未命中只重建一次，超时的等待者不能释放别人的锁 """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_build_once(self):
+        from .services.cache import acoalesced_payload
+        calls = []
+
+        async def build():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return {'value': 1}
+
+        async def storm():
+            return await asyncio.gather(*(acoalesced_payload('test', ('k',), build) for _ in range(10)))
+
+        results = asyncio.run(storm())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 1}] * 10)
+
+    def test_timed_out_waiter_keeps_foreign_lock(self):
+        from .services import cache as cache_service
+        key = cache_service._payload_key('test', ('k',))
+        cache.set(f'lock:{key}', 'someone-else', 10)
+
+        async def build():
+            return {'value': 2}
+
+        with mock.patch.object(cache_service, 'COALESCE_WAIT', 0.05):
+            data = asyncio.run(cache_service.acoalesced_payload('test', ('k',), build))
+        self.assertEqual(data, {'value': 2})
+        self.assertEqual(cache.get(f'lock:{key}'), 'someone-else')
+
+
+class ShoppingItemHooksTests(TestCase):
+    """ 清单项写入后的副作用：分类偏好、热度计数、实时推送；删除整个清单时不逐项处理 """
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.shopping_list = ShoppingList.objects.create(name='weekly', owner=self.owner)
+        self.products = [Product.objects.create(name=f'milk {i}', category='dairy') for i in range(3)]
+
+    def affinity(self):
+        return UserCategoryAffinity.objects.filter(user=self.owner, category='dairy').values_list(
+            'item_count', flat=True).first()
+
+    @mock.patch('shopping.services.live.publish_diffs')
+    @mock.patch('shopping.services.popularity.record_items_changed')
+    def test_create_and_delete_item(self, record, publish):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = ShoppingItem.objects.create(list=self.shopping_list, product=self.products[0])
+        self.assertEqual(self.affinity(), 1)
+        record.assert_called_once_with([self.products[0].pk], [], self.owner.pk)
+        self.assertEqual(publish.call_args.args[1][0]['op'], 'added')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.affinity(), 0)
+        record.assert_called_with([], [self.products[0].pk], self.owner.pk)
+        self.assertEqual(publish.call_args.args[1][0]['op'], 'removed')
+
+    @mock.patch('shopping.services.live.publish_diffs')
+    def test_unchanged_save_publishes_nothing(self, publish):
+        item = ShoppingItem.objects.create(list=self.shopping_list, product=self.products[0])
+        item = ShoppingItem.objects.get(pk=item.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        publish.assert_not_called()
+
+    @mock.patch('shopping.services.popularity.record_items_changed')
+    def test_list_delete_is_batched(self, record):
+        for product in self.products:
+            ShoppingItem.objects.create(list=self.shopping_list, product=product)
+        self.assertEqual(self.affinity(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shopping_list.delete()
+        self.assertEqual(self.affinity(), 0)
+        record.assert_called_once()
+        self.assertCountEqual(record.call_args.args[1], [product.pk for product in self.products])
+
+    def test_list_delete_query_count_is_constant(self):
+        def delete_list(item_count):
+            shopping_list = ShoppingList.objects.create(name=f'list {item_count}', owner=self.owner)
+            for i in range(item_count):
+                product = Product.objects.create(name=f'cheese {item_count}-{i}', category='dairy')
+                ShoppingItem.objects.create(list=shopping_list, product=product)
+            with CaptureQueriesContext(connection) as queries:
+                shopping_list.delete()
+            return len(queries)
+
+        self.assertEqual(delete_list(1), delete_list(20))
+
+
+class BulkShoppingItemsTests(APITestCase):
+    """ 批量增/改/删：一个事务，副作用（缓存、偏好、计数、推送）统一处理一次 """
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.shopping_list = ShoppingList.objects.create(name='weekly', owner=self.owner)
+        self.products = [Product.objects.create(name=f'bread {i}', category='bread_eggs') for i in range(3)]
+        self.kept = ShoppingItem.objects.create(list=self.shopping_list, product=self.products[0])
+        self.removed = ShoppingItem.objects.create(list=self.shopping_list, product=self.products[1])
+        self.url = f'/shopping/shopping-lists/{self.shopping_list.pk}/items/bulk/'
+        self.client.force_authenticate(self.owner)
+
+    @mock.patch('shopping.services.live.publish_diffs')
+    @mock.patch('shopping.services.popularity.record_items_changed')
+    def test_operations_apply_and_publish_once(self, record, publish):
+        etag = self.client.get(f'/shopping/lists/{self.shopping_list.pk}/')['ETag']
+        operations = [
+            {'op': 'add', 'product_id': self.products[2].pk, 'quantity': 2},
+            {'op': 'update', 'product_id': self.products[0].pk, 'is_checked': True},
+            {'op': 'remove', 'product_id': self.products[1].pk},
+            {'op': 'update', 'product_id': 999999},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, {'operations': operations}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'updated', 'removed', 'error'],
+        )
+        self.assertFalse(ShoppingItem.objects.filter(pk=self.removed.pk).exists())
+        self.kept.refresh_from_db()
+        self.assertTrue(self.kept.is_checked)
+
+        record.assert_called_once_with([self.products[2].pk], [self.products[1].pk], self.owner.pk)
+        publish.assert_called_once()
+        self.assertEqual(sorted(diff['op'] for diff in publish.call_args.args[1]), ['added', 'checked', 'removed'])
+        self.assertEqual(
+            UserCategoryAffinity.objects.get(user=self.owner, category='bread_eggs').item_count, 2,
+        )
+        detail = self.client.get(f'/shopping/lists/{self.shopping_list.pk}/', headers={'If-None-Match': etag})
+        self.assertEqual(detail.status_code, 200)
+
+    def test_other_users_list_is_not_found(self):
+        stranger = CustomUser.objects.create_user(username='stranger', email='s@example.com', password='pass')
+        self.client.force_authenticate(stranger)
+        response = self.client.patch(self.url, {'operations': [{'op': 'remove', 'product_id': 1}]}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class DuplicateRowsTests(APITestCase):
+    """ 唯一约束（unique_product_supplier / unique_list_product）冲突时返回 400 或合并，不能 500 """
+
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+        self.supplier = Supplier.objects.create(user=self.vendor)
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.pear = Product.objects.create(name='pear', category='fruit')
+
+    def test_duplicate_offer_is_rejected(self):
+        self.client.force_authenticate(self.vendor)
+        data = {'product': self.apple.pk, 'price': '1.00', 'stock_status': 'in_stock'}
+        self.assertEqual(self.client.post('/shopping/product-supplier/', data).status_code, 201)
+        response = self.client.post('/shopping/product-supplier/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product', response.data)
+
+    def test_moving_offer_onto_existing_product_is_rejected(self):
+        ProductSupplier.objects.create(product=self.apple, supplier=self.supplier, price=1)
+        offer = ProductSupplier.objects.create(product=self.pear, supplier=self.supplier, price=2)
+        self.client.force_authenticate(self.vendor)
+        response = self.client.patch(f'/shopping/product-supplier/{offer.pk}/', {'product': self.apple.pk})
+        self.assertEqual(response.status_code, 400)
+
+    def test_integrity_error_becomes_400(self):
+        ProductSupplier.objects.create(product=self.apple, supplier=self.supplier, price=1)
+        self.client.force_authenticate(self.vendor)
+        # 模拟并发：两个请求都通过了序列化器的检查
+        with mock.patch('shopping.serializers.ProductSupplierSerializer.validate', side_effect=lambda attrs: attrs):
+            response = self.client.post('/shopping/product-supplier/', {'product': self.apple.pk, 'price': '2.00'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_adding_same_product_twice_updates_the_item(self):
+        ProductSupplier.objects.create(product=self.apple, supplier=self.supplier, price=1)
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        shopping_list = ShoppingList.objects.create(name='weekly', owner=owner)
+        self.client.force_authenticate(owner)
+        url = f'/shopping/shopping-lists/{shopping_list.pk}/add-product/{self.apple.pk}/'
+        self.assertEqual(self.client.post(url, {'quantity': 1}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'quantity': 3}).status_code, 200)
+        self.assertEqual(ShoppingItem.objects.get(list=shopping_list).quantity, 3)
+
+
+class AddProductToListTests(APITestCase):
+    """ 加入清单时返回最便宜的有货报价；全部缺货时也能加入，价格为 null """
+
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.shopping_list = ShoppingList.objects.create(name='weekly', owner=self.owner)
+        self.product = Product.objects.create(name='apple', category='fruit')
+        self.suppliers = [
+            Supplier.objects.create(user=CustomUser.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass', is_vendor=True))
+            for name in ('cheap', 'dear')
+        ]
+        self.url = f'/shopping/shopping-lists/{self.shopping_list.pk}/add-product/{self.product.pk}/'
+        self.client.force_authenticate(self.owner)
+
+    def test_cheapest_in_stock_offer(self):
+        ProductSupplier.objects.create(product=self.product, supplier=self.suppliers[0], price=1, stock_status='out_of_stock')
+        ProductSupplier.objects.create(product=self.product, supplier=self.suppliers[1], price=2)
+        response = self.client.post(self.url, {'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['supplier'], 'dear')
+        self.assertEqual(Decimal(str(response.data['price'])), Decimal('2.00'))
+
+    def test_out_of_stock_product_is_still_added(self):
+        ProductSupplier.objects.create(product=self.product, supplier=self.suppliers[0], price=1, stock_status='out_of_stock')
+        response = self.client.post(self.url, {'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['price'])
+        self.assertIsNone(response.data['supplier'])
+        self.assertEqual(ShoppingItem.objects.get(list=self.shopping_list).quantity, 2)
+
+
+class SuggestTests(APITestCase):
+    """ 搜索联想：前缀匹配、limit 取值范围、商品改名后同步 """
+
+    def setUp(self):
+        cache.clear()
+        suggest_index.reset()
+        self.user = CustomUser.objects.create_user(username='user', email='user@example.com', password='pass')
+        for name in ('apple', 'apple juice', 'apricot', 'banana'):
+            Product.objects.create(name=name, category='fruit')
+        self.client.force_authenticate(self.user)
+
+    def suggest(self, **params):
+        response = self.client.get('/shopping/products/suggest/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['suggestions']
+
+    def test_prefix_and_limit(self):
+        self.assertEqual(sorted(self.suggest(q='ap')), ['apple', 'apple juice', 'apricot'])
+        self.assertEqual(len(self.suggest(q='ap', limit=1)), 1)
+        self.assertEqual(len(self.suggest(q='ap', limit=-5)), 1)
+        self.assertEqual(len(self.suggest(q='ap', limit=0)), 1)
+        self.assertEqual(len(self.suggest(q='ap', limit='x')), 3)
+
+    def test_rename_is_visible(self):
+        self.suggest(q='ap')
+        product = Product.objects.get(name='banana')
+        product.name = 'apple pie'
+        product.save()
+        self.assertIn('apple pie', self.suggest(q='apple'))
+        self.assertEqual(self.suggest(q='ban'), [])
+
+    def test_warm_builds_index(self):
+        suggest_index.warm()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(suggest_index.suggest('ban'), ['banana'])
+        self.assertEqual(len(queries), 0)
+
+
+class ShoppingListConsumerTests(TransactionTestCase):
+    """ WebSocket：JWT 鉴权、成员检查、diff 推送和续传 """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        self.stranger = CustomUser.objects.create_user(username='stranger', email='s@example.com', password='pass')
+        self.shopping_list = ShoppingList.objects.create(name='weekly', owner=self.owner)
+        self.product = Product.objects.create(name='eggs', category='bread_eggs')
+
+    def communicator(self, user=None, query=''):
+        from EcoCart.asgi import application
+        params = [f'token={AccessToken.for_user(user)}'] if user else []
+        if query:
+            params.append(query)
+        return WebsocketCommunicator(application, f'/ws/list/{self.shopping_list.pk}/?{"&".join(params)}')
+
+    async def assert_closed_with(self, communicator, code):
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        message = await communicator.receive_output()
+        self.assertEqual(message, {'type': 'websocket.close', 'code': code})
+
+    def test_anonymous_gets_4401(self):
+        asyncio.run(self.assert_closed_with(self.communicator(), 4401))
+
+    def test_non_member_gets_4403(self):
+        asyncio.run(self.assert_closed_with(self.communicator(self.stranger), 4403))
+
+    def test_member_receives_diffs_and_can_resume(self):
+        self.shopping_list.shared_with.add(self.stranger)
+
+        async def scenario():
+            communicator = self.communicator(self.stranger)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await database_sync_to_async(ShoppingItem.objects.create)(
+                list=self.shopping_list, product=self.product, quantity=2)
+            frame = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+
+            # 断线后按序号续传
+            resumed = self.communicator(self.stranger, query='since=0')
+            await resumed.connect()
+            replay = await resumed.receive_json_from(timeout=2)
+            await resumed.disconnect()
+            return frame, replay
+
+        frame, replay = asyncio.run(scenario())
+        self.assertEqual(frame['type'], 'diffs')
+        self.assertEqual(frame['diffs'][0]['op'], 'added')
+        self.assertEqual(frame['diffs'][0]['quantity'], 2)
+        self.assertEqual(replay['diffs'], frame['diffs'])
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """ async 版本的只读接口：认证、分页和响应格式都与同步接口一致 """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+        supplier = Supplier.objects.create(user=vendor)
+        shopping_list = ShoppingList.objects.create(name='weekly', owner=self.owner)
+        yesterday = timezone.now().date() - timedelta(days=1)
+        self.products = []
+        for i in range(3):
+            product = Product.objects.create(name=f'yogurt {i}', category='dairy')
+            ProductSupplier.objects.create(product=product, supplier=supplier, price=5 - i)
+            ShoppingItem.objects.create(list=shopping_list, product=product, expiration_date=yesterday)
+            self.products.append(product)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.owner)}'}
+
+    def get_both(self, sync_url, async_url):
+        sync_response = Client().get(sync_url, headers=self.headers)
+
+        async def fetch():
+            return await AsyncClient().get(async_url, headers=self.headers)
+
+        return sync_response, asyncio.run(fetch())
+
+    def test_expired_items_use_the_same_cursor_pagination(self):
+        sync_page, async_page = self.get_both(
+            '/shopping/shopping-items/expired/?page_size=2', '/shopping/async/shopping-items/expired/?page_size=2')
+        self.assertEqual(sync_page.json(), {
+            **async_page.json(), 'next': async_page.json()['next'].replace('/async/', '/'),
+        })
+        self.assertEqual(set(async_page.json()), {'next', 'previous', 'results'})
+
+        # 同步接口给出的游标可以直接用在 async 接口上
+        cursor_query = sync_page.json()['next'].split('?', 1)[1]
+        sync_next, async_next = self.get_both(
+            f'/shopping/shopping-items/expired/?{cursor_query}', f'/shopping/async/shopping-items/expired/?{cursor_query}')
+        self.assertEqual(len(async_next.json()['results']), 1)
+        self.assertEqual(sync_next.json()['results'], async_next.json()['results'])
+
+    def test_price_comparison_matches_sync(self):
+        product = self.products[2]
+        sync_response, async_response = self.get_both(
+            f'/shopping/supplier-products/compare-prices/{product.pk}/',
+            f'/shopping/async/supplier-products/compare-prices/{product.pk}/',
+        )
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(sync_response.json(), async_response.json())
+        self.assertEqual(async_response.json()['lowest_price'], 3)
+
+    def test_authentication_errors_match_drf(self):
+        async def fetch(headers):
+            return await AsyncClient().get('/shopping/async/recommendations/', headers=headers)
+
+        missing = asyncio.run(fetch({}))
+        self.assertEqual(missing.status_code, 401)
+        self.assertEqual(missing.json(), {'detail': 'Authentication credentials were not provided.'})
+        invalid = asyncio.run(fetch({'Authorization': 'Bearer not-a-token'}))
+        self.assertEqual(invalid.status_code, 401)
+        self.assertIn('WWW-Authenticate', invalid)
+
+    def test_recommendations_share_cache_with_sync(self):
+        sync_response, async_response = self.get_both('/shopping/recommendations/', '/shopping/async/recommendations/')
+        self.assertEqual(sync_response.json(), async_response.json())
+        self.assertEqual(cache_stats('recommendations')['recommendations']['hit'], 1)
+
+
+class VendorCacheTests(TestCase):
+    """ 供应商用户保存时，只有商品数据里出现的字段变化才让目录缓存失效 """
+
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+
+    def catalogue_changed_after(self, change):
+        before = get_version(CATALOGUE)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return get_version(CATALOGUE) != before
+
+    def test_login_does_not_flush_catalogue(self):
+        def login():
+            self.vendor.last_login = timezone.now()
+            self.vendor.save(update_fields=['last_login'])
+        self.assertFalse(self.catalogue_changed_after(login))
+
+    def test_unrelated_full_save_does_not_flush_catalogue(self):
+        def save():
+            self.vendor.first_name = 'Ann'
+            self.vendor.save()
+        self.assertFalse(self.catalogue_changed_after(save))
+
+    def test_rename_flushes_catalogue(self):
+        def rename():
+            self.vendor.username = 'vendor-renamed'
+            self.vendor.save()
+        self.assertTrue(self.catalogue_changed_after(rename))
+
+
+class BumpVersionTests(TestCase):
+    """ 事务里的写入要等提交后才更新版本号，回滚时不更新 """
+
+    def test_bump_waits_for_commit(self):
+        before = get_version(CATALOGUE)
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump_version(CATALOGUE)
+            self.assertEqual(get_version(CATALOGUE), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(CATALOGUE), before)
+
+    def test_rolled_back_write_keeps_version(self):
+        before = get_version(CATALOGUE)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Product.objects.create(name='apple', category='fruit')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(get_version(CATALOGUE), before)
+
+
+class OfferCacheTests(APITestCase):
+    """ 报价改到别的商品上时，原商品的详情缓存也要失效 """
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+        supplier = Supplier.objects.create(user=self.vendor)
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.pear = Product.objects.create(name='pear', category='fruit')
+        self.offer = ProductSupplier.objects.create(product=self.apple, supplier=supplier, price=1)
+        self.client.force_authenticate(self.vendor)
+
+    def test_moving_offer_invalidates_old_product(self):
+        url = f'/shopping/products/{self.apple.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['suppliers_info']), 1)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = self.client.patch(f'/shopping/product-supplier/{self.offer.pk}/', {'product': self.pear.pk})
+        self.assertEqual(moved.status_code, 200)
+
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.client.get(url).data['suppliers_info'], [])
+        self.assertEqual(len(self.client.get(f'/shopping/products/{self.pear.pk}/').data['suppliers_info']), 1)
+
+
+
+class DiscountPriceTests(TestCase):
+    """ 折扣变化后物化价格要跟着更新 """
+
+    def setUp(self):
+        vendor = CustomUser.objects.create_user(username='vendor', email='vendor@example.com', password='pass')
+        self.supplier = Supplier.objects.create(user=vendor, company_name='Green Farm')
+        self.apple = Product.objects.create(name='Apple', category='fruit')
+        self.pear = Product.objects.create(name='Pear', category='fruit')
+        self.apple_offer = ProductSupplier.objects.create(product=self.apple, supplier=self.supplier, price=10)
+        self.pear_offer = ProductSupplier.objects.create(product=self.pear, supplier=self.supplier, price=20)
+        now = timezone.now()
+        self.discount = Discount.objects.create(
+            product=self.apple, supplier=self.supplier, discount_type='percentage', discount_value=10,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+
+    def final_price(self, offer):
+        return EffectivePrice.objects.get(product_supplier=offer).final_price
+
+    def test_moving_discount_refreshes_both_offers(self):
+        self.assertEqual(self.final_price(self.apple_offer), Decimal('9.00'))
+
+        self.discount.product = self.pear
+        self.discount.save()
+
+        self.assertEqual(self.final_price(self.apple_offer), Decimal('10.00'))
+        self.assertEqual(self.final_price(self.pear_offer), Decimal('18.00'))
+
+    def test_serializer_resolves_price_once_per_row(self):
+        offer = ProductSupplier.objects.with_prices().get(pk=self.apple_offer.pk)
+        with mock.patch('shopping.serializers.resolve_price', wraps=resolve_price) as resolve:
+            data = SupplierInfoSerializer(offer).data
+        self.assertEqual(resolve.call_count, 1)
+        self.assertEqual(data['discount']['value'], '10.00')
+        self.assertEqual(Decimal(data['final_price']), Decimal('9.00'))
+
+
+class EffectivePriceTests(TestCase):
+    """ 物化价格：当前折扣、下一次变价时间、库存状态 """
+
+    def setUp(self):
+        vendor = CustomUser.objects.create_user(username='vendor', email='vendor@example.com', password='pass')
+        self.supplier = Supplier.objects.create(user=vendor)
+        self.product = Product.objects.create(name='Milk', category='dairy')
+        self.offer = ProductSupplier.objects.create(product=self.product, supplier=self.supplier, price=10)
+        self.now = timezone.now()
+
+    def discount(self, discount_type, value, starts, ends):
+        return Discount.objects.create(
+            product=self.product, supplier=self.supplier, discount_type=discount_type, discount_value=value,
+            valid_from=self.now + timedelta(days=starts), valid_until=self.now + timedelta(days=ends),
+        )
+
+    def test_active_discount_and_next_change(self):
+        self.discount('fixed', 3, -1, 5)
+        upcoming = self.discount('percentage', 50, 2, 4)
+        self.discount('percentage', 90, -5, -1)
+
+        row, = refresh_effective_prices([self.offer], now=self.now)
+        self.assertEqual(row.final_price, Decimal('7.00'))
+        self.assertEqual(row.valid_until, upcoming.valid_from)
+
+        # 到了下一次变价时间，先创建的折扣仍然优先
+        row, = refresh_effective_prices([self.offer], now=upcoming.valid_from)
+        self.assertEqual(row.final_price, Decimal('7.00'))
+
+    def test_expired_row_falls_back_to_live_price(self):
+        self.discount('percentage', 20, -2, 1)
+        offer = ProductSupplier.objects.with_prices().get(pk=self.offer.pk)
+        self.assertEqual(resolve_price(offer)[1], Decimal('8.00'))
+        self.assertEqual(resolve_price(offer, now=self.now + timedelta(days=2))[1], Decimal('10.00'))
+
+    def test_out_of_stock(self):
+        self.offer.stock_status = 'out_of_stock'
+        self.offer.save()
+        self.assertFalse(EffectivePrice.objects.get(product_supplier=self.offer).in_stock)
+
+
+class BasketPriceTests(APITestCase):
+    """ 一篮子商品比价：每个商品最便宜的报价、数量、买不到的商品和单一供应商总价 """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='user', email='user@example.com', password='pass')
+        self.cheap, self.full = [
+            Supplier.objects.create(user=CustomUser.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass', is_vendor=True))
+            for name in ('cheap', 'full')
+        ]
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.pear = Product.objects.create(name='pear', category='fruit')
+        self.rare = Product.objects.create(name='rare', category='fruit')
+        ProductSupplier.objects.create(product=self.apple, supplier=self.cheap, price=1)
+        ProductSupplier.objects.create(product=self.apple, supplier=self.full, price=2)
+        ProductSupplier.objects.create(product=self.pear, supplier=self.full, price=3)
+        ProductSupplier.objects.create(product=self.rare, supplier=self.cheap, price=1, stock_status='out_of_stock')
+        self.client.force_authenticate(self.user)
+
+    def test_basket(self):
+        product_ids = [self.apple.pk, self.apple.pk, self.pear.pk, self.rare.pk]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/shopping/supplier-products/compare-prices/', {'product_ids': product_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        items = {item['product']: item for item in response.data['items']}
+        self.assertEqual(items['apple']['supplier'], 'cheap')
+        self.assertEqual(items['apple']['quantity'], 2)
+        self.assertEqual(Decimal(items['apple']['line_total']), Decimal('2.00'))
+        self.assertEqual(items['pear']['supplier'], 'full')
+        self.assertEqual(Decimal(response.data['total']), Decimal('5.00'))
+        self.assertEqual(response.data['unavailable'], [self.rare.pk])
+        self.assertEqual(response.data['cheapest_single_supplier']['supplier'], 'full')
+        self.assertEqual(Decimal(response.data['cheapest_single_supplier']['total']), Decimal('7.00'))
+
+        # 查询次数与商品数量无关
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.post('/shopping/supplier-products/compare-prices/', {'product_ids': product_ids * 50}, format='json')
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_empty_basket_is_rejected(self):
+        response = self.client.post('/shopping/supplier-products/compare-prices/', {'product_ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkOfferTests(APITestCase):
+    """ 供应商批量改价 / 改库存 """
+
+    def setUp(self):
+        self.vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+        self.supplier = Supplier.objects.create(user=self.vendor)
+        other = Supplier.objects.create(user=CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='pass', is_vendor=True))
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.pear = Product.objects.create(name='pear', category='fruit')
+        self.apple_offer = ProductSupplier.objects.create(product=self.apple, supplier=self.supplier, price=1)
+        self.pear_offer = ProductSupplier.objects.create(product=self.pear, supplier=other, price=2)
+        self.client.force_authenticate(self.vendor)
+
+    def test_bulk_update(self):
+        catalogue = get_version(CATALOGUE)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/shopping/product-supplier/bulk/', {'offers': [
+                {'product': self.apple.pk, 'price': '4.50', 'stock_status': 'out_of_stock'},
+                {'product': self.pear.pk, 'price': '0.10'},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['product'] for error in response.data['errors']], [self.pear.pk])
+
+        effective = EffectivePrice.objects.get(product_supplier=self.apple_offer)
+        self.assertEqual(effective.final_price, Decimal('4.50'))
+        self.assertFalse(effective.in_stock)
+        # 其他供应商的报价不能改
+        self.pear_offer.refresh_from_db()
+        self.assertEqual(self.pear_offer.price, Decimal('2.00'))
+        self.assertNotEqual(get_version(CATALOGUE), catalogue)
+
+    def test_change_without_fields_is_rejected(self):
+        response = self.client.patch('/shopping/product-supplier/bulk/', {'offers': [{'product': self.apple.pk}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_customers_cannot_bulk_update(self):
+        customer = CustomUser.objects.create_user(username='customer', email='c@example.com', password='pass')
+        self.client.force_authenticate(customer)
+        response = self.client.patch('/shopping/product-supplier/bulk/', {'offers': [
+            {'product': self.apple.pk, 'price': '4.50'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class CatalogueImportTests(APITestCase):
+    """ 供应商上传 CSV / JSONL 导入商品和报价，响应是逐块的 NDJSON 进度 """
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+        self.supplier = Supplier.objects.create(user=self.vendor)
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.client.force_authenticate(self.vendor)
+
+    def upload(self, name, content, **data):
+        response = self.client.post(
+            '/shopping/product-supplier/import/',
+            {'file': SimpleUploadedFile(name, content.encode()), **data},
+            format='multipart',
+        )
+        if response.status_code != 200:
+            return response, None
+        return response, [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_csv_import(self):
+        response, events = self.upload('catalogue.csv', (
+            'name,category,price,stock_status\n'
+            'apple,fruit,1.20,in_stock\n'
+            'kiwi,fruit,0.80,\n'
+            'broken,fruit,abc,in_stock\n'
+            'milk,not-a-category,1,in_stock\n'
+        ))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        summary = events[-1]
+        self.assertEqual(summary['type'], 'summary')
+        self.assertEqual(
+            {key: summary[key] for key in ('rows', 'products_created', 'offers_created', 'offers_updated', 'errors')},
+            {'rows': 4, 'products_created': 1, 'offers_created': 2, 'offers_updated': 0, 'errors': 2},
+        )
+        self.assertEqual([error['line'] for error in events[0]['chunk_errors']], [4, 5])
+
+        # 已有商品按 (name, category) 匹配，不重复创建
+        self.assertEqual(Product.objects.filter(name='apple').count(), 1)
+        kiwi = EffectivePrice.objects.get(product__name='kiwi', supplier=self.supplier)
+        self.assertEqual(kiwi.final_price, Decimal('0.80'))
+
+    def test_jsonl_reimport_updates_offers(self):
+        content = '{"name": "apple", "category": "fruit", "price": "1.00"}\nnot json\n'
+        self.upload('catalogue.jsonl', content)
+        catalogue = get_version(CATALOGUE)
+        with self.captureOnCommitCallbacks(execute=True):
+            _, events = self.upload('catalogue.txt', content.replace('1.00', '2.00'), format='ndjson')
+
+        self.assertEqual(events[-1]['offers_updated'], 1)
+        self.assertEqual(events[-1]['errors'], 1)
+        self.assertEqual(ProductSupplier.objects.get(product=self.apple, supplier=self.supplier).price, Decimal('2.00'))
+        self.assertNotEqual(get_version(CATALOGUE), catalogue)
+
+    def test_unsupported_format(self):
+        response, _ = self.upload('catalogue.xlsx', 'name')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductSearchTests(APITestCase):
+    """ 商品搜索按相关度排序，所有词都要命中 """
+
+    def setUp(self):
+        cache.clear()
+        vendor = CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', password='pass', is_vendor=True)
+        for name, category in (('green apple', 'fruit'), ('apple juice', 'juice'), ('orange juice', 'juice')):
+            Product.objects.create(name=name, category=category)
+        self.client.force_authenticate(vendor)
+
+    def search(self, query):
+        response = self.client.get('/shopping/products/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.data['results']]
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('apple juice'), ['apple juice'])
+        self.assertEqual(sorted(self.search('juice')), ['apple juice', 'orange juice'])
+        self.assertEqual(self.search('banana'), [])
+
+    def test_prefix_match(self):
+        self.assertEqual(sorted(self.search('app')), ['apple juice', 'green apple'])
+
+    def test_new_product_is_searchable(self):
+        self.search('juice')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='grape juice', category='juice')
+        self.assertIn('grape juice', self.search('juice'))
+
+
+class ExpiryReminderTests(TestCase):
+    """ 过期提醒：按用户分片派发，每个用户一封汇总邮件 """
+
+    def setUp(self):
+        supplier = Supplier.objects.create(user=CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', is_vendor=True))
+        today = timezone.now().date()
+        self.users = []
+        for i in range(5):
+            user = CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+            shopping_list = ShoppingList.objects.create(name='weekly', owner=user)
+            for days in (0, 2, 10):
+                product = Product.objects.create(name=f'milk {i}-{days}', category='dairy')
+                ProductSupplier.objects.create(product=product, supplier=supplier, price=1)
+                ShoppingItem.objects.create(list=shopping_list, product=product, expiration_date=today + timedelta(days=days))
+            self.users.append(user)
+
+    def test_one_digest_per_user_across_shards(self):
+        # chunk_size 小于单个用户的商品数，也不能把一个用户拆成两封邮件
+        check_expiring_products.apply(kwargs={'shards': 3, 'chunk_size': 1})
+
+        recipients = sorted(message.to[0] for message in mail.outbox)
+        self.assertEqual(recipients, sorted(user.email for user in self.users))
+        for message in mail.outbox:
+            # 每封邮件包含该用户快过期的两个商品，10 天后才过期的不提醒
+            self.assertEqual(message.body.count('expires on'), 2)
+        self.assertEqual(ShoppingItem.objects.filter(reminder_sent=True).count(), 10)
+
+    def test_shard_only_covers_its_owners(self):
+        shards = 3
+        result = send_expiry_reminders.apply(args=(1, shards)).get()
+        owners = {user.email for user in self.users if user.pk % shards == 1}
+        self.assertEqual({message.to[0] for message in mail.outbox}, owners)
+        self.assertEqual(result['sent'], len(owners))
+
+    def test_second_run_sends_nothing(self):
+        first = send_expiry_reminders.apply(args=(0, 1)).get()
+        second = send_expiry_reminders.apply(args=(0, 1)).get()
+        self.assertEqual(first['sent'], 5)
+        self.assertEqual(second['sent'], 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_items_claimed_by_an_overlapping_run_are_skipped(self):
+        owner = self.users[0]
+        # 模拟另一个 worker 已经认领了这个用户的商品、还没发完
+        claimed = _claim_items(list(ShoppingItem.objects.filter(list__owner=owner).values_list('pk', flat=True)))
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(_claim_items(list(claimed)), set())
+
+        send_expiry_reminders.apply(args=(0, 1))
+        self.assertNotIn(owner.email, [message.to[0] for message in mail.outbox])
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_failed_send_releases_claims(self):
+        owner = self.users[0]
+        send_messages = EmailBackend.send_messages
+
+        def flaky_send(backend, messages):
+            if messages[0].to == [owner.email]:
+                raise OSError('SMTP connection lost')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', flaky_send), \
+                self.assertLogs('shopping.tasks', level='ERROR'):
+            result = send_expiry_reminders.apply(args=(0, 1)).get()
+        self.assertEqual((result['sent'], result['failed']), (4, 1))
+        self.assertFalse(ShoppingItem.objects.filter(list__owner=owner, reminder_sent=True).exists())
+
+        # 重试时只给失败的用户补发
+        retry = send_expiry_reminders.apply(args=(0, 1)).get()
+        self.assertEqual(retry['sent'], 1)
+        self.assertEqual(mail.outbox[-1].to, [owner.email])
+
+
+class ItemNeighbourTests(TestCase):
+    """ 协同过滤：共现矩阵 → 余弦相似度 → top-N 邻居 → 按用户历史打分 """
+
+    def setUp(self):
+        self.products = {
+            name: Product.objects.create(name=name, category='bread_eggs')
+            for name in ('bread', 'butter', 'jam', 'milk')
+        }
+        baskets = [
+            ('bread', 'butter', 'jam'),
+            ('bread', 'butter'),
+            ('bread', 'butter', 'milk'),
+            ('bread', 'jam'),
+        ]
+        self.users = []
+        for i, basket in enumerate(baskets):
+            user = CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+            shopping_list = ShoppingList.objects.create(name='weekly', owner=user)
+            for name in basket:
+                ShoppingItem.objects.create(list=shopping_list, product=self.products[name])
+            self.users.append(user)
+
+    def neighbours_of(self, name):
+        return [
+            (neighbour.neighbour.name, round(neighbour.score, 3))
+            for neighbour in ProductNeighbour.objects.filter(product=self.products[name])
+            .select_related('neighbour').order_by('-score')
+        ]
+
+    def test_cosine_neighbours(self):
+        # bread 出现在 4 个清单，butter 3 个、jam 2 个；共现次数不足 2 的组合（butter-jam、*-milk）不保留
+        self.assertEqual(build_item_neighbours(), 4)
+        self.assertEqual(self.neighbours_of('bread'), [('butter', 0.866), ('jam', 0.707)])
+        self.assertEqual(self.neighbours_of('butter'), [('bread', 0.866)])
+        self.assertEqual(self.neighbours_of('jam'), [('bread', 0.707)])
+        self.assertEqual(self.neighbours_of('milk'), [])
+
+    def test_top_n(self):
+        build_item_neighbours(top_n=1)
+        self.assertEqual(self.neighbours_of('bread'), [('butter', 0.866)])
+
+    def test_scores_exclude_products_already_bought(self):
+        build_item_neighbours()
+        ids = {product.pk: name for name, product in self.products.items()}
+
+        def recommended(user):
+            return [(ids[product_id], round(score, 3)) for product_id, score in score_for_user(user)]
+
+        self.assertEqual(recommended(self.users[3]), [('butter', 0.866)])
+        self.assertEqual(recommended(self.users[2]), [('jam', 0.707)])
+        self.assertEqual(recommended(self.users[0]), [])
+
+    def test_history_weights(self):
+        build_item_neighbours()
+        # 历史里 bread 出现两次，butter 的得分按次数加权翻倍
+        shopping_list = ShoppingList.objects.create(name='party', owner=self.users[3])
+        ShoppingItem.objects.create(list=shopping_list, product=self.products['jam'])
+        ShoppingItem.objects.create(list=shopping_list, product=self.products['bread'])
+        self.assertEqual(
+            [(product_id, round(score, 3)) for product_id, score in score_for_user(self.users[3])],
+            [(self.products['butter'].pk, round(2 * 0.866, 3))],
+        )
+
+
+class FakeRedis:
+    """ 测试用的内存版 Redis，只实现热度计数器用到的命令；HyperLogLog 用集合精确计数 """
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def zincrby(self, key, amount, member):
+        zset = self.data.setdefault(key, {})
+        member = str(member).encode()
+        zset[member] = zset.get(member, 0.0) + amount
+        return zset[member]
+
+    def zadd(self, key, mapping):
+        zset = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            zset[str(member).encode()] = float(score)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.data.get(key, {})
+        for member in [member for member, score in zset.items() if float(low) <= score <= float(high)]:
+            del zset[member]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        ranked = sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+        ranked = ranked[start:end + 1 if end >= 0 else None]
+        return ranked if withscores else [member for member, _ in ranked]
+
+    def pfadd(self, key, *members):
+        self.data.setdefault(key, set()).update(str(member).encode() for member in members)
+
+    def pfcount(self, key):
+        return len(self.data.get(key, ()))
+
+    def expire(self, key, ttl):
+        return key in self.data
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def rename(self, source, target):
+        self.data[target] = self.data.pop(source)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.client, name), args, kwargs))
+        return queue
+
+    def execute(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class PopularityCounterTests(TestCase):
+    """ 热度计数器：写入时增减，Redis 漏记或出错后由 reconcile 按数据库校准 """
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch('shopping.services.popularity.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.pear = Product.objects.create(name='pear', category='fruit')
+        self.users = [
+            CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com') for i in range(3)
+        ]
+
+    def add_items(self, user, *products):
+        with self.captureOnCommitCallbacks(execute=True):
+            shopping_list = ShoppingList.objects.create(name='weekly', owner=user)
+            return [ShoppingItem.objects.create(list=shopping_list, product=product) for product in products]
+
+    def test_increment_then_reconcile(self):
+        self.add_items(self.users[0], self.apple, self.pear)
+        self.add_items(self.users[1], self.apple)
+        pear_item, = self.add_items(self.users[2], self.pear)
+        with self.captureOnCommitCallbacks(execute=True):
+            pear_item.delete()
+
+        expected = [(self.apple.pk, 2), (self.pear.pk, 1)]
+        self.assertEqual(popularity.top_products(), expected)
+        # 当天分桶只记新增，删除不回退
+        self.assertEqual(dict(popularity.top_products(day=timezone.localdate())), {self.apple.pk: 2, self.pear.pk: 2})
+        self.assertEqual(popularity.active_user_count(), 3)
+
+        # 批量写入不经过信号，计数器和数据库出现偏差
+        shopping_list = ShoppingList.objects.get(owner=self.users[2])
+        ShoppingItem.objects.bulk_create([ShoppingItem(list=shopping_list, product=self.apple)])
+        self.redis.zincrby(popularity.PRODUCTS_KEY, 5, self.pear.pk)
+        self.assertNotEqual(popularity.top_products(), [(self.apple.pk, 3), (self.pear.pk, 1)])
+
+        popularity.reconcile()
+        self.assertEqual(popularity.top_products(), [(self.apple.pk, 3), (self.pear.pk, 1)])
+        self.assertEqual(popularity.top_products(day=timezone.localdate()), [(self.apple.pk, 3), (self.pear.pk, 1)])
+        self.assertEqual(popularity.active_user_count(), 3)
+        self.assertEqual(popularity.active_user_count(day=timezone.localdate()), 3)
+
+    def test_redis_errors_do_not_break_writes(self):
+        with mock.patch.object(FakePipeline, 'execute', side_effect=redis.ConnectionError), \
+                self.assertLogs('shopping.services.popularity', level='WARNING'):
+            self.add_items(self.users[0], self.apple)
+        self.assertEqual(ShoppingItem.objects.count(), 1)
+        self.assertEqual(popularity.top_products(), [])
+        with mock.patch.object(FakeRedis, 'zrevrange', side_effect=redis.ConnectionError), \
+                self.assertLogs('shopping.services.popularity', level='WARNING'):
+            self.assertIsNone(popularity.top_products())
+
+
+class RollupTests(APITestCase):
+    """ 仪表盘汇总：按水位线增量汇总，重复运行不会重复计数 """
+
+    def setUp(self):
+        supplier = Supplier.objects.create(user=CustomUser.objects.create_user(
+            username='vendor', email='vendor@example.com', is_vendor=True))
+        self.apple = Product.objects.create(name='apple', category='fruit')
+        self.milk = Product.objects.create(name='milk', category='dairy')
+        for product in (self.apple, self.milk):
+            ProductSupplier.objects.create(product=product, supplier=supplier, price=1)
+        self.users = []
+        for i, products in enumerate([(self.apple, self.milk), (self.apple,)]):
+            user = CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+            shopping_list = ShoppingList.objects.create(name='weekly', owner=user)
+            for product in products:
+                ShoppingItem.objects.create(list=shopping_list, product=product)
+            self.users.append(user)
+        self.today = timezone.localdate()
+
+    def run_rollups(self):
+        # 跳过 SETTLE_DELAY，刚写入的数据也参与汇总
+        return run_rollups(now=timezone.now() + timedelta(hours=1))
+
+    def day_totals(self):
+        categories = dict(
+            CategoryRollup.objects.filter(period=RollupPeriod.DAY, period_start=self.today)
+            .values_list('category', 'items_added')
+        )
+        activity = ActivityRollup.objects.get(period=RollupPeriod.DAY, period_start=self.today)
+        return categories, (activity.lists_created, activity.new_users, activity.active_users)
+
+    def test_rerun_does_not_double_count(self):
+        self.assertEqual(self.run_rollups(), {'shopping_item': 3, 'shopping_list': 2, 'user': 3})
+        first = self.day_totals()
+        self.assertEqual(first, ({'fruit': 2, 'dairy': 1}, (2, 3, 2)))
+        self.assertEqual(SupplierRollup.objects.get(period=RollupPeriod.DAY).items_added, 3)
+
+        self.assertEqual(self.run_rollups(), {})
+        self.assertEqual(self.day_totals(), first)
+
+        # 只汇总水位线之后的新数据
+        ShoppingItem.objects.create(list=ShoppingList.objects.get(owner=self.users[1]), product=self.milk)
+        self.assertEqual(self.run_rollups(), {'shopping_item': 1})
+        self.assertEqual(self.day_totals(), ({'fruit': 2, 'dairy': 2}, (2, 3, 2)))
+        self.assertEqual(CategoryRollup.objects.get(period=RollupPeriod.WEEK, category='dairy').items_added, 2)
+
+    def test_small_batches_give_the_same_totals(self):
+        with mock.patch('shopping.services.rollups.ROLLUP_BATCH', 1):
+            self.run_rollups()
+        self.assertEqual(self.day_totals(), ({'fruit': 2, 'dairy': 1}, (2, 3, 2)))
+        self.assertEqual(RollupWatermark.objects.get(source='shopping_item').last_id, ShoppingItem.objects.latest('pk').pk)
+
+    def test_recent_rows_wait_for_settle_delay(self):
+        self.assertEqual(run_rollups(), {})
+
+    def test_dashboard_range(self):
+        self.run_rollups()
+        admin = CustomUser.objects.create_user(username='admin', email='admin@example.com', is_admin=True)
+        self.client.force_authenticate(admin)
+        with mock.patch('shopping.services.popularity.get_client', return_value=FakeRedis()):
+            response = self.client.get('/shopping/admin/dashboard/', {
+                'start': (self.today - timedelta(days=6)).isoformat(), 'end': self.today.isoformat(),
+            })
+        self.assertEqual(response.status_code, 200)
+        rollups = response.data['rollups']
+        self.assertEqual([row['period_start'] for row in rollups['series']], [self.today])
+        self.assertEqual(rollups['active_users'], 2)
+        self.assertEqual({row['category']: row['items'] for row in rollups['items_by_category']}, {'fruit': 2, 'dairy': 1})
+
+    def test_range_validation(self):
+        def errors(**params):
+            serializer = DashboardRangeSerializer(data=params)
+            return None if serializer.is_valid() else serializer.errors
+
+        # 首尾都包含在内，最多 366 天
+        self.assertIsNone(errors(start='2025-01-01', end='2026-01-01'))
+        self.assertIsNotNone(errors(start='2025-01-01', end='2026-01-02'))
+        self.assertIsNotNone(errors(start='2025-02-01', end='2025-01-31'))
+
+        defaults = DashboardRangeSerializer(data={})
+        self.assertTrue(defaults.is_valid())
+        self.assertEqual(defaults.validated_data['end'] - defaults.validated_data['start'], timedelta(days=29))
@@ -2,8 +2,9 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, ShoppingListViewSet, ShoppingItemViewSet, SharedShoppingListView, ProductPriceComparisonView, AddProductToShoppingListView, RemoveProductFromShoppingListView, ProductSupplierViewSet, ExpiringProductsView, ExpiredProductView,SupplierListView,RecommendationView
+from .views import ProductViewSet, ShoppingListViewSet, ShoppingItemViewSet, ProductPriceComparisonView, AddProductToShoppingListView, RemoveProductFromShoppingListView, ProductSupplierViewSet, ExpiringProductsView, ExpiredProductView,SupplierListView,RecommendationView, BasketPriceComparisonView, ShoppingListPriceView, BulkShoppingItemsView
 from .views_admin import AdminDashboardView 
+from . import views_async
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)  
@@ -14,12 +15,21 @@ router.register(r'product-supplier', ProductSupplierViewSet, basename='product-s
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('list/share/<uuid:uuid>/', SharedShoppingListView.as_view(), name='shared-shopping-list'),
+    # 共享清单只有 async 实现（请求合并需要在事件循环上等待）
+    path('list/share/<uuid:uuid>/', views_async.shared_shopping_list, name='shared-shopping-list'),
     path('supplier-products/compare-prices/<int:product_id>/', ProductPriceComparisonView.as_view(), name='compare-product-prices'),
+    path('supplier-products/compare-prices/', BasketPriceComparisonView.as_view(), name='compare-basket-prices'),
+    path('shopping-lists/<int:shopping_list_id>/items/bulk/', BulkShoppingItemsView.as_view(), name='bulk-shopping-items'),
+    path('shopping-lists/<int:shopping_list_id>/price/', ShoppingListPriceView.as_view(), name='price-shopping-list'),
     path('shopping-lists/<int:shopping_list_id>/add-product/<int:product_id>/', AddProductToShoppingListView.as_view(), name='add-product-to-list'),
     path('shopping-lists/<int:shopping_list_id>/remove-product/<int:product_id>/', RemoveProductFromShoppingListView.as_view(), name='remove-product-from-list'), 
     path('admin/dashboard/', AdminDashboardView.as_view(), name='admin-dashboard'),
     path('shopping-items/expiring/', ExpiringProductsView.as_view(), name='expiring-products'),
     path('shopping-items/expired/', ExpiredProductView.as_view(), name='expiring-products'),
     path('recommendations/', RecommendationView.as_view(), name='recommended-products'),
+    # async 版本的热点只读接口（需要在 ASGI 下运行才有意义）
+    path('async/supplier-products/compare-prices/<int:product_id>/', views_async.product_price_comparison, name='async-compare-product-prices'),
+    path('async/shopping-items/expiring/', views_async.expiring_products, name='async-expiring-products'),
+    path('async/shopping-items/expired/', views_async.expired_products, name='async-expired-products'),
+    path('async/recommendations/', views_async.recommendations, name='async-recommended-products'),
 ]
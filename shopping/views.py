@@ -1,13 +1,33 @@
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import viewsets, generics, permissions, status
 from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework.response import Response
 from .models import ShoppingList, ShoppingItem, Product, ProductSupplier, Supplier
-from .serializers import ShoppingListSerializer, ShoppingItemSerializer, ProductSerializer, ProductSupplierSerializer, SupplierSerializer
+from .serializers import DUPLICATE_OFFER_MESSAGE, ShoppingListSerializer, ShoppingItemSerializer, ProductSerializer, ProductSupplierSerializer, SupplierSerializer, BasketPriceRequestSerializer, BulkShoppingItemsSerializer, BulkOfferChangeSerializer
 from users.permissions import IsVendorOrAdmin, IsVendor
-from rest_framework.exceptions import PermissionDenied
+from .filters import ProductSearchFilter
+from .pagination import absolute_page_links, relative_page_links
+from .services.suggest import suggest_index, SUGGEST_LIMIT
+from .services.affinity import top_categories
+from .services.recommendation import score_for_user
+from .services.pricing import product_offers_prefetches, price_basket
+from .services.list_items import apply_item_operations
+from .services.offers import bulk_update_offers
+from .services.catalogue_import import CatalogueImport, ImportFormatError, detect_format, iter_rows
+from .services.cache import (
+    cached_payload, conditional_get, get_version, query_fingerprint,
+    product_scope, list_scope, user_lists_scope, CATALOGUE, SUPPLIERS, NEIGHBOURS,
+)
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count
+from collections import Counter
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 
 
@@ -15,14 +35,81 @@ class SupplierListView(viewsets.ReadOnlyModelViewSet):
     queryset = Supplier.objects.select_related('user').filter(user__is_vendor=True)
     serializer_class = SupplierSerializer
 
+    def list(self, request, *args, **kwargs):
+        build = super().list
+        data = cached_payload(
+            'suppliers', (get_version(SUPPLIERS), query_fingerprint(request)),
+            lambda: relative_page_links(build(request, *args, **kwargs).data),
+        )
+        return Response(absolute_page_links(request, data))
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+        data = cached_payload(
+            'suppliers', (get_version(SUPPLIERS), 'detail', kwargs['pk']),
+            lambda: build(request, *args, **kwargs).data,
+        )
+        return Response(data)
+
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'category']
+    filter_backends = [ProductSearchFilter]
     permission_classes = [IsVendorOrAdmin]
 
+    def get_queryset(self):
+        # 报价连同物化的最终价格一次性预取，避免每个 ProductSupplier 单独查折扣
+        return Product.objects.prefetch_related(*product_offers_prefetches())
+
+    def list(self, request, *args, **kwargs):
+        # 商品目录很少变化，按目录版本号 + 查询参数缓存序列化结果
+        build = super().list
+        fingerprint = query_fingerprint(request)
+
+        def render():
+            data = cached_payload(
+                'products', (get_version(CATALOGUE), fingerprint),
+                lambda: relative_page_links(build(request, *args, **kwargs).data),
+            )
+            return Response(absolute_page_links(request, data))
+
+        return conditional_get(request, [CATALOGUE], render, extra=fingerprint)
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+        scope = product_scope(kwargs['pk'])
+
+        def render():
+            data = cached_payload(
+                'product', (kwargs['pk'], get_version(scope), get_version(SUPPLIERS)),
+                lambda: build(request, *args, **kwargs).data,
+            )
+            return Response(data)
+
+        # 供应商改名也会影响商品详情里的 supplier_name
+        return conditional_get(request, [scope, SUPPLIERS], render, extra=kwargs['pk'])
+
+    @action(
+        detail=False, methods=['get'],
+        authentication_classes=[JWTStatelessUserAuthentication],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def suggest(self, request):
+        """
+        搜索框联想：从进程内前缀树返回 top-k 商品名，不访问数据库
+        （JWT 也只做无状态校验，不查用户表）。
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', SUGGEST_LIMIT)), SUGGEST_LIMIT))
+        except ValueError:
+            limit = SUGGEST_LIMIT
+        return Response({
+            'query': query,
+            'suggestions': suggest_index.suggest(query, limit),
+        })
+
     def perform_create(self, serializer):
         if self.request.user.is_vendor:
             supplier = Supplier.objects.get(user=self.request.user)
@@ -34,28 +121,24 @@ class ProductViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You are not authorized to create products.")  # 如果不是供应商，抛出权限错误
 
     def perform_update(self, serializer):
-        if self.request.user.is_vendor:
-            product = self.get_object()
-            
-            supplier = Supplier.objects.get(user=self.request.user)
+        if not self.request.user.is_vendor:
+            raise PermissionDenied("You are not authorized to update products.")
 
-            # 确保供应商是当前产品的供应商
-            product_supplier = ProductSupplier.objects.filter(product=product, supplier=supplier).first()
-            if not product_supplier:
-                raise PermissionDenied("You are not authorized to update the price for this product.")
-            
-            # 更新价格
-            new_price = serializer.validated_data.get('price')  # 假设价格字段名为 'price'
-            if new_price:
-                product_supplier.price = new_price
-                product_supplier.save()
+        # update() 已经通过 get_object() 取到商品，不再重复查询
+        product_supplier = ProductSupplier.objects.filter(
+            product=serializer.instance, supplier__user=self.request.user,
+        ).first()
+        if not product_supplier:
+            raise PermissionDenied("You are not authorized to update the price for this product.")
+
+        # 更新价格
+        new_price = serializer.validated_data.get('price')
+        if new_price:
+            product_supplier.price = new_price
+            product_supplier.save(update_fields=['price'])
+
+        serializer.save()
 
-            print(f"ProductSupplier updated: {product_supplier.product.name}, {product_supplier.price}")
-            
-            serializer.save()
-        else:
-            raise PermissionDenied("You are not authorized to update products.")
-        
     def perform_destroy(self, instance):
         # 只有供应商或管理员才能删除产品
         if self.request.user.is_vendor or self.request.user.is_staff:
@@ -73,7 +156,52 @@ class ProductSupplierViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         supplier = Supplier.objects.get(user=self.request.user)
-        serializer.save(supplier=supplier)
+        self._save_offer(serializer, supplier=supplier)
+
+    def perform_update(self, serializer):
+        self._save_offer(serializer)
+
+    def _save_offer(self, serializer, **kwargs):
+        # 序列化器已经检查过重复报价，这里兜住并发请求同时通过检查的情况
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            raise ValidationError({'product': DUPLICATE_OFFER_MESSAGE})
+
+    @action(detail=False, methods=['patch'], url_path='bulk')
+    def bulk_update(self, request):
+        """
+        批量改价/改库存：{"offers": [{"product": 1, "price": "9.90"}, {"product": 2, "stock_status": "out_of_stock"}]}
+        只能修改当前供应商自己的报价，一个事务完成，缓存只失效一次。
+        """
+        serializer = BulkOfferChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        supplier = Supplier.objects.get(user=request.user)
+        updated, errors = bulk_update_offers(supplier, serializer.validated_data['offers'])
+        return Response({"updated": updated, "errors": errors})
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalogue(self, request):
+        """
+        上传 CSV / JSONL 文件（字段 file，列 name, category, price, stock_status, description）
+        批量导入商品和当前供应商的报价。响应是 NDJSON 流：每处理完一块输出一行进度和该块的错误，
+        最后一行为汇总。
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fmt = detect_format(upload.name, request.data.get('format'))
+        except ImportFormatError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        supplier = Supplier.objects.get(user=request.user)
+        events = CatalogueImport(supplier).run(iter_rows(upload.file, fmt))
+        return StreamingHttpResponse(
+            (json.dumps(event, cls=DjangoJSONEncoder) + '\n' for event in events),
+            content_type='application/x-ndjson',
+        )
 
 class ShoppingListViewSet(viewsets.ModelViewSet):
     queryset = ShoppingList.objects.all()
@@ -82,7 +210,24 @@ class ShoppingListViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # 用户拥有的或共享给他的列表
-        return ShoppingList.objects.filter(owner=self.request.user).distinct()
+        return ShoppingList.objects.filter(owner=self.request.user).distinct().with_items()
+
+    def list(self, request, *args, **kwargs):
+        # 清单或目录都没变化时直接返回 304，不执行查询和序列化
+        build = super().list
+        return conditional_get(
+            request, [user_lists_scope(request.user.pk), CATALOGUE],
+            lambda: build(request, *args, **kwargs),
+            extra=query_fingerprint(request),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+        return conditional_get(
+            request, [list_scope(kwargs['pk']), CATALOGUE],
+            lambda: build(request, *args, **kwargs),
+            extra=f'{request.user.pk}:{kwargs["pk"]}',
+        )
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -94,7 +239,7 @@ class ShoppingItemViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = ShoppingItem.objects.filter(list__owner=self.request.user)
+        queryset = ShoppingItem.objects.filter(list__owner=self.request.user).with_product()
         expiring_soon = self.request.query_params.get('expiring_soon')
         if expiring_soon:
             today = timezone.now().date()
@@ -103,16 +248,6 @@ class ShoppingItemViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class SharedShoppingListView(APIView):
-    def get(self, request, uuid):
-        try:
-            shopping_list = ShoppingList.objects.get(uuid=uuid, is_shared=True)
-            serializer = ShoppingListSerializer(shopping_list)
-            return Response(serializer.data)
-        except ShoppingList.DoesNotExist:
-            return Response({"detail": "List not found or not shared."}, status=status.HTTP_404_NOT_FOUND)
-
-
 class RemoveProductFromShoppingListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -128,6 +263,25 @@ class RemoveProductFromShoppingListView(APIView):
             return Response({"detail": "Product not found in shopping list."}, status=status.HTTP_404_NOT_FOUND)
 
 
+class BulkShoppingItemsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def patch(self, request, shopping_list_id):
+        """
+        一次提交多个增/改/删操作，在一个事务里执行，返回每个操作的结果：
+        {"operations": [{"op": "add", "product_id": 1, "quantity": 2}, {"op": "remove", "product_id": 3}]}
+        """
+        try:
+            shopping_list = ShoppingList.objects.get(id=shopping_list_id, owner=request.user)
+        except ShoppingList.DoesNotExist:
+            return Response({"detail": "Shopping list not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = BulkShoppingItemsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_item_operations(shopping_list, serializer.validated_data['operations'])
+        return Response({"results": results})
+
+
 class ProductPriceComparisonView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -135,24 +289,49 @@ class ProductPriceComparisonView(APIView):
         """
         比较不同供应商提供的商品价格，返回最低价格的商品及供应商信息。
         """
-        product = Product.objects.get(id=product_id)
-        product_suppliers = ProductSupplier.objects.filter(product=product)
+        offer = ProductSupplier.objects.cheapest_for([product_id]).first()
 
-        if not product_suppliers.exists():
+        if offer is None:
             return Response({"detail": "No suppliers found for this product."}, status=status.HTTP_404_NOT_FOUND)
 
-        # 找到最低价格的供应商
-        lowest_price_supplier = min(product_suppliers, key=lambda ps: ps.price)
-        lowest_price = lowest_price_supplier.price
-        supplier = lowest_price_supplier.supplier.user.username
-
         return Response({
-            'product': product.name,
-            'lowest_price': lowest_price,
-            'supplier': supplier,
+            'product': offer.product.name,
+            'lowest_price': offer.final_price,
+            'supplier': offer.supplier.user.username,
         })
 
 
+class BasketPriceComparisonView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        一次比较多个商品的价格，查询次数与商品数量无关。
+        """
+        serializer = BasketPriceRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantities = Counter(serializer.validated_data['product_ids'])
+        return Response(price_basket(quantities))
+
+
+class ShoppingListPriceView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, shopping_list_id):
+        """
+        给整个购物清单比价：每个商品的最低价供应商、总价和最便宜的单一供应商。
+        """
+        try:
+            shopping_list = ShoppingList.objects.get(id=shopping_list_id, owner=request.user)
+        except ShoppingList.DoesNotExist:
+            return Response({"detail": "Shopping list not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        quantities = Counter()
+        for product_id, quantity in shopping_list.items.values_list('product_id', 'quantity'):
+            quantities[product_id] += quantity
+        return Response(price_basket(quantities))
+
+
 class AddProductToShoppingListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -163,14 +342,10 @@ class AddProductToShoppingListView(APIView):
             quantity = request.data.get('quantity', 1)  # 获取请求中的数量，默认为1
             expiration_date = request.data.get('expiration_date')  # 支持用户自定义过期时间
 
-            # 查找该商品在所有供应商中的最低价格
-            product_suppliers = ProductSupplier.objects.filter(product=product)
-            if not product_suppliers.exists():
-                return Response({"detail": "No suppliers found for this product."}, status=status.HTTP_404_NOT_FOUND)
-
-            lowest_price_supplier = min(product_suppliers, key=lambda ps: ps.price)
-            price = lowest_price_supplier.price
-            supplier = lowest_price_supplier.supplier.user.username 
+            # 查找该商品在所有供应商中的最低价格；暂时都缺货时仍然可以加入清单，价格和供应商返回 null
+            offer = ProductSupplier.objects.cheapest_for([product.id]).first()
+            price = offer.final_price if offer else None
+            supplier = offer.supplier.user.username if offer else None
 
             #将商品添加到购物清单中
             shopping_item, created = ShoppingItem.objects.update_or_create(
@@ -195,35 +370,75 @@ class AddProductToShoppingListView(APIView):
             return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
         
 #还没过期，但快要过期的商品
-class ExpiringProductsView(APIView):
+class ExpiringProductsView(generics.ListAPIView):
+    serializer_class = ShoppingItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
+    def get_queryset(self):
         today = timezone.now().date()
         soon = today + timedelta(days=3)
-        items = ShoppingItem.objects.filter(
-            list__owner=request.user,
+        return ShoppingItem.objects.filter(
+            list__owner=self.request.user,
             expiration_date__range=(today, soon),
             reminder_sent=False  # 只取还没提醒过的
-        )
-        serializer = ShoppingItemSerializer(items, many=True)
-        return Response(serializer.data)
+        ).with_product()
     
     
 #已经过期的商品
-class ExpiredProductView(APIView):
+class ExpiredProductView(generics.ListAPIView):
+    serializer_class = ShoppingItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
+    def get_queryset(self):
         today = timezone.now().date()
-        items = ShoppingItem.objects.filter(
-            list__owner=request.user,
+        return ShoppingItem.objects.filter(
+            list__owner=self.request.user,
             expiration_date__lt=today
-        )
-        serializer = ShoppingItemSerializer(items, many=True)
-        return Response(serializer.data)
+        ).with_product()
     
     
+RECOMMENDATION_LIMIT = 10
+
+
+def category_recommendations(user, limit=RECOMMENDATION_LIMIT):
+    """ 用户最常买的分类下、还没买过的商品（分类来自预计算的 UserCategoryAffinity） """
+    top = top_categories(user.pk, limit=1)
+    if not top:
+        return None
+    purchased_product_ids = ShoppingItem.objects.filter(list__owner_id=user.pk).values('product_id')
+    products = (
+        Product.objects
+        .filter(category=top[0])
+        .exclude(id__in=purchased_product_ids)
+        .prefetch_related(*product_offers_prefetches())
+        .order_by('-id')[:limit]
+    )
+    return ProductSerializer(products, many=True).data
+
+
+def item_based_recommendations(user, limit=RECOMMENDATION_LIMIT):
+    """ 与用户买过的商品经常出现在同一清单里的商品，按协同过滤得分排序 """
+    scored = score_for_user(user, limit=limit)
+    products = Product.objects.filter(id__in=[product_id for product_id, _ in scored]).prefetch_related(
+        *product_offers_prefetches()
+    )
+    by_id = {product.id: product for product in products}
+    return ProductSerializer([by_id[product_id] for product_id, _ in scored if product_id in by_id], many=True).data
+
+
+def discounted_products(limit=RECOMMENDATION_LIMIT):
+    """ 当前正在打折的商品，读物化价格表 """
+    now = timezone.now()
+    products = (
+        Product.objects
+        .filter(effective_prices__discount__isnull=False, effective_prices__valid_until__gt=now)
+        .distinct()
+        .prefetch_related(*product_offers_prefetches())
+        .order_by('-id')[:limit]
+    )
+    return ProductSerializer(products, many=True).data
+
+
 #根据用户购买过的产品找出常买的category，再推荐这个类别下的产品 + 当前有折扣的商品。
 class RecommendationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -231,40 +446,23 @@ class RecommendationView(APIView):
     def get(self, request):
         user = request.user
 
-        # 1. 获取用户购买过的产品类别
-        items = ShoppingItem.objects.filter(list__owner=user)
-        category_counts = (
-            items
-            .values('product__category')
-            .annotate(count=Count('product'))
-            .order_by('-count')
+        # 用户的清单、商品目录或相似度表变化时缓存自动失效
+        recommendations = cached_payload(
+            'recommendations',
+            (user.pk, get_version(user_lists_scope(user.pk)), get_version(CATALOGUE), get_version(NEIGHBOURS)),
+            lambda: {
+                'category_based': category_recommendations(user),
+                'item_based': item_based_recommendations(user),
+            },
         )
-
-        if not category_counts:
+        if recommendations['category_based'] is None:
             return Response({"message": "No purchase history yet."})
 
-        top_category = category_counts[0]['product__category']
-
-        # 2. 推荐这个分类下的产品（排除用户已购买的）
-        purchased_product_ids = items.values_list('product__id', flat=True)
-        recommended_products = Product.objects.filter(
-            category=top_category
-        ).exclude(id__in=purchased_product_ids)
-
-        # 3. 推荐当前正在打折的商品
-        now = timezone.now()
-        discounted_products = Product.objects.filter(
-            discount__valid_from__lte=now,
-            discount__valid_until__gte=now
-        ).distinct()
-
-        # 序列化输出
-        rec_products_serialized = ProductSerializer(recommended_products, many=True).data
-        discount_products_serialized = ProductSerializer(discounted_products, many=True).data
+        # 打折商品与用户无关，所有用户共用一份缓存
+        discounted = cached_payload('discounted_products', (get_version(CATALOGUE),), discounted_products)
 
         return Response({
-            "category_based_recommendations": rec_products_serialized,
-            "discounted_products": discount_products_serialized
+            "category_based_recommendations": recommendations['category_based'],
+            "item_based_recommendations": recommendations['item_based'],
+            "discounted_products": discounted
         })
-    
-
@@ -6,6 +6,11 @@ from rest_framework.permissions import IsAuthenticated
 from users.models import CustomUser
 from shopping.models import Product, ShoppingItem
 from django.db.models import Count
+from django.utils import timezone
+from shopping.services.cache import cache_stats
+from shopping.services import popularity
+from shopping.services.rollups import rollup_report
+from shopping.serializers import DashboardRangeSerializer
 
 class AdminDashboardView(APIView):
     permission_classes = [IsAuthenticated]
@@ -14,21 +19,41 @@ class AdminDashboardView(APIView):
         if not request.user.is_admin:
             return Response({'detail': 'Permission denied'}, status=403)
 
-        # 最受欢迎商品（购买次数最多）
-        popular_products = (
-            ShoppingItem.objects.values('product__name')
-            .annotate(count=Count('product'))
-            .order_by('-count')[:5]
-        )
+        # ?start=2025-01-01&end=2025-01-31&period=day|week，数据来自每小时更新的汇总表
+        params = DashboardRangeSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        # 最受欢迎商品（购买次数最多），读 Redis 计数器，不可用时回退到数据库聚合
+        popular_products = self.top_products(popularity.top_products(5))
+        if popular_products is None:
+            popular_products = (
+                ShoppingItem.objects.values('product__name')
+                .annotate(count=Count('product'))
+                .order_by('-count')[:5]
+            )
 
         # 用户数量
         user_count = CustomUser.objects.count()
 
-        # 活跃用户（有购物清单的）
-        active_users = CustomUser.objects.filter(owned_shopping_lists__isnull=False).distinct().count()
+        # 活跃用户（有购物清单的），HyperLogLog 近似计数
+        active_users = popularity.active_user_count()
+        if active_users is None:
+            active_users = CustomUser.objects.filter(owned_shopping_lists__isnull=False).distinct().count()
 
         return Response({
             "user_count": user_count,
             "active_users": active_users,
             "top_products": popular_products,
+            "top_products_today": self.top_products(popularity.top_products(5, day=timezone.localdate())),
+            "active_users_today": popularity.active_user_count(day=timezone.localdate()),
+            "cache": cache_stats('products', 'product', 'suppliers', 'shared_list'),
+            "rollups": rollup_report(**params.validated_data),
         })
+
+    @staticmethod
+    def top_products(ranked):
+        """ [(商品 id, 数量)] -> 与原来 values('product__name') 相同的格式 """
+        if ranked is None:
+            return None
+        names = dict(Product.objects.filter(id__in=[pid for pid, _ in ranked]).values_list('id', 'name'))
+        return [{'product__name': names[pid], 'count': count} for pid, count in ranked if pid in names]
@@ -0,0 +1,140 @@
+# shopping/views_async.py
+"""
+热点只读接口的 async 版本，跑在 ASGI 事件循环上，认证和缓存读写（aget / aset）不占线程。
+认证、分页和响应格式与同步接口一致，客户端可以直接切换。
+只有单条查询（比价、共享清单 uuid）用 async ORM。分页接口（快过期 / 已过期）没有用：
+Django 的 async ORM 内部也是 sync_to_async，先 async for 取一页再到线程里序列化会多一次线程切换，
+所以取数据和序列化合并成一次 sync_to_async；推荐接口只在缓存未命中时进线程。
+"""
+from datetime import timedelta
+from functools import partial, wraps
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from .models import ShoppingItem, ProductSupplier
+from .pagination import StableCursorPagination
+from .serializers import ShoppingItemSerializer
+from .views import category_recommendations, item_based_recommendations, discounted_products
+from .services.cache import acached_payload, aget_version, user_lists_scope, CATALOGUE, NEIGHBOURS
+from .services.shared_lists import ashared_list_entry, shared_list_response
+
+
+# 与 DRF 的 JSONRenderer 用同一个编码器：Decimal 输出为数字，日期格式也一致
+json_response = partial(JsonResponse, encoder=JSONEncoder)
+
+
+def _not_found(detail):
+    return json_response({"detail": detail}, status=404)
+
+
+def jwt_required(view):
+    """
+    与同步接口用同一个 DRF 认证类（JWTStatelessUserAuthentication，和搜索联想一样不查用户表），
+    错误响应也与 DRF 一致；用户放在 request.token_user。
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authentication = JWTStatelessUserAuthentication()
+        try:
+            result = authentication.authenticate(request)
+        except APIException as exc:
+            return _unauthorized(authentication, exc.detail)
+        if result is None:
+            return _unauthorized(authentication, NotAuthenticated.default_detail)
+        request.token_user = result[0]
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _unauthorized(authentication, detail):
+    response = json_response({"detail": detail}, status=401)
+    response['WWW-Authenticate'] = authentication.authenticate_header(None)
+    return response
+
+
+async def shared_shopping_list(request, uuid):
+    # 公开链接可能被大量访问：返回缓存的 JSON 字节，并带上 ETag / Cache-Control 让代理也能缓存；
+    # 缓存失效时只有一个请求重建，其他请求在事件循环上等待，不占线程
+    return shared_list_response(request, await ashared_list_entry(uuid))
+
+
+@jwt_required
+async def product_price_comparison(request, product_id):
+    offer = await ProductSupplier.objects.cheapest_for([product_id]).afirst()
+    if offer is None:
+        return _not_found("No suppliers found for this product.")
+    return json_response({
+        'product': offer.product.name,
+        'lowest_price': offer.final_price,
+        'supplier': offer.supplier.user.username,
+    })
+
+
+def _paginate_items(request, queryset):
+    """ 与同步接口同一个游标分页（StableCursorPagination），cursor 参数和 {next, previous, results} 格式都一样 """
+    paginator = StableCursorPagination()
+    drf_request = Request(request)
+    page = paginator.paginate_queryset(queryset.with_product(), drf_request)
+    return paginator.get_paginated_response(ShoppingItemSerializer(page, many=True).data).data
+
+
+async def _item_page(request, queryset):
+    # CursorPagination 内部同步地取数据，取一页和序列化合并成一次 sync_to_async
+    try:
+        data = await sync_to_async(_paginate_items)(request, queryset)
+    except NotFound as exc:
+        return _not_found(exc.detail)
+    return json_response(data)
+
+
+# 还没过期，但快要过期的商品
+@jwt_required
+async def expiring_products(request):
+    today = timezone.now().date()
+    return await _item_page(request, ShoppingItem.objects.filter(
+        list__owner_id=request.token_user.pk,
+        expiration_date__range=(today, today + timedelta(days=3)),
+        reminder_sent=False,
+    ))
+
+
+# 已经过期的商品
+@jwt_required
+async def expired_products(request):
+    return await _item_page(request, ShoppingItem.objects.filter(
+        list__owner_id=request.token_user.pk,
+        expiration_date__lt=timezone.now().date(),
+    ))
+
+
+@jwt_required
+async def recommendations(request):
+    # 与同步的 RecommendationView 共用缓存键，两边谁先算好另一边直接命中
+    user = request.token_user
+    catalogue_version = await aget_version(CATALOGUE)
+    key_parts = (
+        user.pk, await aget_version(user_lists_scope(user.pk)), catalogue_version, await aget_version(NEIGHBOURS),
+    )
+    payload = await acached_payload(
+        'recommendations',
+        key_parts,
+        sync_to_async(lambda: {
+            'category_based': category_recommendations(user),
+            'item_based': item_based_recommendations(user),
+        }),
+    )
+    if payload['category_based'] is None:
+        return json_response({"message": "No purchase history yet."})
+
+    discounted = await acached_payload('discounted_products', (catalogue_version,), sync_to_async(discounted_products))
+    return json_response({
+        "category_based_recommendations": payload['category_based'],
+        "item_based_recommendations": payload['item_based'],
+        "discounted_products": discounted,
+    })
@@ -0,0 +1,35 @@
+# users/middleware.py
+from urllib.parse import parse_qs
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+def _raw_token(scope):
+    """ 优先取 Authorization: Bearer 头，浏览器的 WebSocket 不能设置请求头，再看 ?token= """
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin1').split()
+            if len(parts) == 2 and parts[0].lower() == 'bearer':
+                return parts[1]
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    return token[0] if token else None
+
+
+def user_from_token(raw_token):
+    """ 只校验签名和有效期，用 TokenUser 表示用户，不查用户表 """
+    try:
+        return api_settings.TOKEN_USER_CLASS(AccessToken(raw_token))
+    except TokenError:
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """ Channels 中间件：从 JWT 解析 scope['user']，和 REST 接口使用同一套令牌 """
+
+    async def __call__(self, scope, receive, send):
+        raw_token = _raw_token(scope)
+        user = user_from_token(raw_token) if raw_token else AnonymousUser()
+        return await super().__call__(dict(scope, user=user), receive, send)
@@ -26,7 +26,7 @@ class UserShoppingListView(generics.ListAPIView):
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
-        return ShoppingList.objects.filter(owner=user_id)
+        return ShoppingList.objects.filter(owner=user_id).with_items()
     
 class RegisterView(APIView):
     def post(self, request):